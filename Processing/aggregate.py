@@ -26,6 +26,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 import glob
 import sys
+import os
+import bisect
 from numba import jit
 
 class CleanedData:
@@ -44,6 +46,14 @@ class FeatureData:
     # data
     pass
 
+class FeatureState:
+    """Holds what is needed to continue a feature series with new data"""
+    # Context -- trailing rows of cleaned data, np.float32, size (L,6)
+    #   L = ContextLength(FeatureParams), or fewer near the start
+    # Filters -- volume EMA filter values after the last row
+    #   short EMAs then long EMAs, np.float64
+    pass
+
 class FeatureParameters:
     def __init__(self,IntervalsPerDay=0):
         # interval sizes for aggregated log price relatives
@@ -79,6 +89,148 @@ class FeatureParameters:
             IntervalsPerDay,
         ]
 
+def ReadComposite(FName,StartTime=None,EndTime=None):
+    """Memory-mapped view of a composite data file
+
+    Arguments:
+    - FName -- composite file name, e.g. 'composite/NFLX.dat'
+    - StartTime -- optional unix time (seconds),
+      keep only rows with data[:,0] >= StartTime
+    - EndTime -- optional unix time (seconds),
+      keep only rows with data[:,0] < EndTime
+
+    Return Value:
+    - np.memmap of np.float64, size (N,6), read only
+      data[:,0] is unix times (seconds), start of the interval
+      data[:,1] is close price, dollars
+      data[:,2] is high price, dollars
+      data[:,3] is low price, dollars
+      data[:,4] is open price, dollars
+      data[:,5] is share unit volume
+      * nothing is read until used, and pages are shared
+        through the page cache by all processes reading the file
+      * the time range is found by binary search on data[:,0],
+        touching only a few pages
+    """
+    NumRows = os.path.getsize(FName)//(6*8)
+    if NumRows == 0:
+        # can't map an empty file
+        return np.zeros((0,6))
+    data = np.memmap(FName,dtype=np.float64,mode='r',shape=(NumRows,6))
+    First = 0
+    Last = NumRows
+    # bisect on the strided column, np.searchsorted would
+    # first copy the whole column out of the file
+    if StartTime is not None:
+        First = bisect.bisect_left(data[:,0],StartTime)
+    if EndTime is not None:
+        Last = bisect.bisect_left(data[:,0],EndTime,lo=First)
+    return data[First:Last]
+
+
+
+
+
+
+def DayIndexFileName(FName):
+    """composite/<SYM>.idx for composite/<SYM>.dat"""
+    return FName[:-4] + '.idx'
+
+
+
+
+
+
+def ReadDayIndex(FName,data=None):
+    """Day start indices of a composite file, from its sidecar index
+
+    Arguments:
+    - FName -- composite file name, e.g. 'composite/NFLX.dat'
+    - data -- optional ReadComposite(FName), if already open
+
+    Return Value:
+    - np.array of np.int32, size (NumDays)
+      same as GetDayStartIndices(ReadComposite(FName))
+
+    Notes:
+    - the index is stored in DayIndexFileName(FName) as int64
+      pairs (day start row, unix time of that row)
+    - the index is brought up to date, and saved, if the composite
+      file was appended to or its tail rewritten by the collector:
+      indexed days are kept up to the last one whose start row
+      still has the same time and still follows a >8h gap,
+      only the rows after that are scanned
+    """
+    if data is None:
+        data = ReadComposite(FName)
+    IdxName = DayIndexFileName(FName)
+    Index = np.zeros((0,2),dtype=np.int64)
+    if os.path.exists(IdxName):
+        Index = np.fromfile(IdxName,dtype=np.int64)
+        Index.shape = (Index.shape[0]//2,2)
+
+    # find the last indexed day that is still valid
+    Keep = Index.shape[0]
+    while Keep > 0:
+        Row,Time = Index[Keep-1]
+        if (Row < data.shape[0] and int(data[Row,0]) == Time
+                and (Row == 0 or data[Row,0]-data[Row-1,0] >= 8*60*60)):
+            break
+        Keep -= 1
+
+    # rescan from the start of the last valid day, which also
+    # picks up any days appended after it
+    Rescan = 0 if Keep == 0 else Index[Keep-1,0]
+    NewStarts = Rescan + GetDayStartIndices(data[Rescan:]).astype(np.int64)
+    NewIndex = np.concatenate([Index[:max(Keep-1,0)],
+        np.stack([NewStarts,data[NewStarts,0].astype(np.int64)],axis=1)])
+    if not np.array_equal(NewIndex,Index):
+        NewIndex.tofile(IdxName+'.tmp')
+        os.replace(IdxName+'.tmp',IdxName)
+    Index = NewIndex
+    return Index[:,0].astype(np.int32)
+
+
+
+
+
+
+def ReadCompositeDays(FName,FirstDay=None,LastDay=None):
+    """Memory-mapped rows of a composite file for a range of days
+
+    Arguments:
+    - FName -- composite file name, e.g. 'composite/NFLX.dat'
+    - FirstDay, LastDay -- trading days [FirstDay,LastDay),
+      with python slice rules, e.g. FirstDay=-30 for the last 30 days
+
+    Return Value:
+    - data -- np.memmap of np.float64, size (n,6), read only
+      rows of ReadComposite(FName) for those days only
+    - DayStarts -- np.array of np.int32, day starts within data
+      * pass to AggregateDataVectorized with data
+
+    Notes:
+    - uses ReadDayIndex, so only the rows of those days are read
+    - data starts exactly at a day start, so the first aggregate
+      interval can differ from a full aggregation: it misses
+      after-hours rows of the day before, and fills with the first
+      open rather than the previous close if it is empty
+    """
+    data = ReadComposite(FName)
+    DayStarts = ReadDayIndex(FName,data)
+    Ends = np.append(DayStarts[1:],data.shape[0])
+    Days = np.arange(len(DayStarts))[FirstDay:LastDay]
+    if len(Days) == 0:
+        return data[:0],np.array([],dtype=np.int32)
+    First = DayStarts[Days[0]]
+    Last = Ends[Days[-1]]
+    return data[First:Last],(DayStarts[Days]-First).astype(np.int32)
+
+
+
+
+
+
 def GetDayStartIndices(data):
     """Determine indices for each start of a trading day
 
@@ -96,23 +248,12 @@ def GetDayStartIndices(data):
      - np.array of np.int32, size (NumDays)
     """
 
-    # points at the beginning of an open market period
-    CheckPnt = 0
-
-    # return values
-    DayStarts = np.array([],dtype=np.int32)
-
-    while CheckPnt < data.shape[0]:
-        DayStarts = np.append(DayStarts,CheckPnt)
-        # this will point to the next market open time
-        EndPnt = CheckPnt+1
-        # compare with prev point, stop searching if time diff is big
-        while EndPnt < data.shape[0] and (data[EndPnt,0]-data[EndPnt-1,0])<8*60*60:
-            EndPnt += 1
-        # EndPnt now points to next start of market period
-        CheckPnt = EndPnt
-
-    return DayStarts
+    if data.shape[0] == 0:
+        return np.array([],dtype=np.int32)
+    # a new trading day starts wherever the time since the
+    # previous point is at least 8 hours
+    Gaps = np.flatnonzero(np.diff(data[:,0]) >= 8*60*60) + 1
+    return np.concatenate([[0],Gaps]).astype(np.int32)
 
 
 
@@ -124,7 +265,8 @@ def AlignStartTime(DayStartTime,TimeReference):
      start time for that trading day
 
     Arguments:
-    - DayStartTime -- unix time during a trading day
+    - DayStartTime -- unix time during a trading day,
+      or np.array of them (all mapped in one call)
       should be one of the following:
       - exactly N*TimeReference+9.5*60*60 or slightly after
       - exactly N*TimeReference+10.5*60*60 or slightly after
@@ -140,16 +282,12 @@ def AlignStartTime(DayStartTime,TimeReference):
     # account for daylight saving time
     # check that seconds after midnight less than 10.5*3600
     # i.e. before 10:30am
-    if np.mod( DayStartTime - TimeReference , 3600*24 ) < (105*360):
-        # eastern time is GMT-04:00
-        DayStartTime -= TimeReference
-        # start time at exactly 9:30am
-        DayStartTime = (DayStartTime//(24*3600))*(24*3600) + 95*360
-    else:
-        # eastern time is GMT-05:00
-        DayStartTime -= TimeReference
-        # start time at exactly 9:30am
-        DayStartTime = (DayStartTime//(24*3600))*(24*3600) + 105*360
+    # if so, eastern time is GMT-04:00, else GMT-05:00
+    Daylight = np.mod( DayStartTime - TimeReference , 3600*24 ) < (105*360)
+    DayStartTime = DayStartTime - TimeReference
+    # start time at exactly 9:30am
+    DayStartTime = (DayStartTime//(24*3600))*(24*3600) \
+        + np.where(Daylight,95*360,105*360)
     return DayStartTime + TimeReference
 
 
@@ -260,6 +398,107 @@ def AggregateData(data,period):
 
 
 
+
+
+
+def AggregateDataVectorized(data,period,FirstDay=0,DayStarts=None):
+    """Create a clean dataset, identical to AggregateData
+
+    Arguments:
+    - data -- np.array of np.float64, size (N,6)
+      same layout as for AggregateData
+    - period -- integer number of minutes per aggregated trading period
+    - FirstDay -- skip the trading days before this one
+      * retval.data is then AggregateData(data,period).data
+        from row FirstDay*IntervalsPerDay onward
+      * only the raw rows from the day before FirstDay onward
+        are looked at
+    - DayStarts -- optional GetDayStartIndices(data), e.g. from
+      ReadDayIndex, to avoid scanning all of data for it
+
+    Return Value:
+    - instance of CleanedData, same as AggregateData
+      * NumDays counts the kept days only
+      * FirstDay is the index of the first kept day
+
+    Notes:
+    - all raw rows are assigned to their aggregate interval at
+      once (binary search against the interval end times), then
+      high, low and volume are segmented reductions
+      (np.maximum.reduceat and friends) instead of one small
+      slice per interval
+    - empty intervals are filled in with the same rules as
+      AggregateData
+    - assumes data[:,0] is increasing, as written by the collector
+    """
+
+    # 2014-04-02 00:00:00 GMT-04:00 DST
+    TimeReference = 1396411200.0
+    # trading hours are 09:30 to 16:00 = 6.5 hours
+    IntervalsPerDay = int(np.ceil(6.5*60/period))
+    if DayStarts is None:
+        DayStarts = GetDayStartIndices(data)
+    NumDays = max(len(DayStarts)-FirstDay,0)
+    ReturnData = np.zeros([NumDays*IntervalsPerDay, 6],dtype=np.float32)
+
+    if NumDays > 0:
+        # the day before FirstDay tells where FirstDay begins
+        PrevDay = max(FirstDay-1,0)
+        # unix time of 9:30am for each trading day
+        DayStartTimes = AlignStartTime(data[DayStarts[PrevDay:],0],TimeReference)
+        Offsets = np.arange(IntervalsPerDay)*60*period
+        # period start
+        ReturnData[:,0] = ((DayStartTimes[FirstDay-PrevDay:,np.newaxis] + Offsets
+            - TimeReference) / (24*3600)).ravel()
+
+        # raw rows with time <= end of the aggregate interval
+        # are used up by the time that interval is done
+        # (all rows before the start of PrevDay are used up
+        # by the end of PrevDay)
+        IntervalEnds = (DayStartTimes[:,np.newaxis] + (Offsets+60*period)).ravel()
+        IntervalEnds = np.maximum.accumulate(IntervalEnds)
+        Base = DayStarts[PrevDay]
+        Ends = Base + np.searchsorted(data[Base:,0],IntervalEnds,side='right')
+        if FirstDay == 0:
+            Ends = np.concatenate([[0],Ends])
+        else:
+            Ends = Ends[IntervalsPerDay-1:]
+        Starts = Ends[:-1]
+        Ends = Ends[1:]
+
+        # aggregate the data [Starts,Ends) where there is some
+        Filled = Ends > Starts
+        if np.any(Filled):
+            Base = Starts[0]
+            Used = Ends[-1]
+            Segments = Starts[Filled]-Base
+            # close, high, low, open, volume
+            ReturnData[Filled,1] = data[Ends[Filled]-1,1]
+            ReturnData[Filled,2] = np.maximum.reduceat(data[Base:Used,2],Segments)
+            ReturnData[Filled,3] = np.minimum.reduceat(data[Base:Used,3],Segments)
+            ReturnData[Filled,4] = data[Starts[Filled],4]
+            ReturnData[Filled,5] = np.add.reduceat(data[Base:Used,5],Segments)
+
+        # close, high, low, open
+        # use close of previous, or first open if nothing came before
+        Empty = np.logical_not(Filled)
+        Fill = np.where(Starts[Empty]>0,data[Starts[Empty]-1,1],data[0,4])
+        for i in range(1,5):
+            ReturnData[Empty,i] = Fill
+        # volume
+        ReturnData[Empty,5] = 0
+
+    # construct return value
+    RetVal = CleanedData()
+    RetVal.IntervalsPerDay = IntervalsPerDay
+    RetVal.NumDays = NumDays
+    RetVal.FirstDay = FirstDay
+    RetVal.period = period
+    RetVal.data = ReturnData
+    return RetVal
+
+
+
 FeatureIndex = 1
 
 
@@ -305,6 +544,100 @@ def FeatureLPR(data,PriceIndex,Interval):
 
 
 
+def RollingMax(x,Window):
+    """ maximum over a trailing window, for every element
+    Arguments:
+    - x -- 1-D np.array
+    - Window -- number of elements in the window
+
+    Return Value:
+    - np.array, same size and type as x
+      retval[i] = max(x[max(i-Window+1,0):(i+1)])
+    """
+    return _RollingExtreme(x,Window,np.maximum)
+
+
+
+
+
+
+def RollingMin(x,Window):
+    """ minimum over a trailing window, for every element
+    Arguments:
+    - x -- 1-D np.array
+    - Window -- number of elements in the window
+
+    Return Value:
+    - np.array, same size and type as x
+      retval[i] = min(x[max(i-Window+1,0):(i+1)])
+    """
+    return _RollingExtreme(x,Window,np.minimum)
+
+
+
+
+
+
+def _RollingExtreme(x,Window,Op):
+    # van Herk/Gil-Werman algorithm:
+    # cut the series into blocks of Window elements and take
+    # running extremes forward and backward within each block.
+    # any window spans at most two blocks, so its extreme is
+    # Op(backward at its first element, forward at its last).
+    # O(N) per window size, independent of Window.
+    N = x.shape[0]
+    if N == 0 or Window <= 1:
+        return x.copy()
+    # x[0] is in every window that is cut off by the start of
+    # the series, so padding with copies of it changes nothing
+    NumBlocks = -(-(N+Window-1)//Window)
+    Padded = np.empty(NumBlocks*Window,dtype=x.dtype)
+    Padded[:Window-1] = x[0]
+    Padded[Window-1:Window-1+N] = x
+    Padded[Window-1+N:] = x[-1]
+    Blocks = Padded.reshape(NumBlocks,Window)
+    Forward = Op.accumulate(Blocks,axis=1).ravel()
+    Backward = Op.accumulate(Blocks[:,::-1],axis=1)[:,::-1].ravel()
+    # window ending at x[i] is Padded[i:i+Window]
+    return Op(Backward[:N],Forward[Window-1:Window-1+N])
+
+
+
+
+
+
+def FeatureLPRBlock(data,Strides,out=None):
+    """ get time series of price relatives, all prices and strides
+    Arguments:
+    - data -- cleaned data, np.array of np.float32, size (K,6)
+      same layout as for FeatureLPR
+    - Strides -- list of intervals, e.g. FeatureParameters.StridesLPR
+    - out -- optional np.array, size (K,4*len(Strides)), to write into
+
+    Return Value:
+    - np.array of np.float32, size (K,4*len(Strides))
+      columns are FeatureLPR(data,PriceIndex,Interval)
+        for PriceIndex in range(1,5)
+        for Interval in Strides
+    """
+    NumStrides = len(Strides)
+    if out is None:
+        out = np.empty((data.shape[0],4*NumStrides),dtype=np.float32)
+    Rows = np.arange(data.shape[0])
+    for j,Interval in enumerate(Strides):
+        # close from element i-Interval of data
+        PrevClose = data[np.maximum(Rows-Interval,0),1]
+        np.log(data[:,1]/PrevClose,out=out[:,j])
+        np.log(RollingMax(data[:,2],Interval)/PrevClose,out=out[:,NumStrides+j])
+        np.log(RollingMin(data[:,3],Interval)/PrevClose,out=out[:,2*NumStrides+j])
+        np.log(data[:,4]/PrevClose,out=out[:,3*NumStrides+j])
+    return out
+
+
+
+
+
+
 def FeatureAverageLPR(data,PriceIndex,Interval):
     """ get time series of price relatives w.r.t. SMA
     Arguments:
@@ -346,6 +679,42 @@ def FeatureAverageLPR(data,PriceIndex,Interval):
 
 
 
+def FeatureAverageLPRBlock(data,Strides,out=None,PriceIndex=1):
+    """ get time series of price relatives w.r.t. SMA, all strides
+    Arguments:
+    - data -- cleaned data, np.array of np.float32, size (K,6)
+      same layout as for FeatureAverageLPR
+    - Strides -- list of SMA window sizes, e.g. FeatureParameters.StridesSMA
+    - out -- optional np.array, size (K,len(Strides)), to write into
+    - PriceIndex -- 1 for close, 2 for high, 3 for low, 4 for open
+
+    Return Value:
+    - np.array of np.float32, size (K,len(Strides))
+      out[:,j] is FeatureAverageLPR(data,PriceIndex,Strides[j])
+      (the first Strides[j] rows average over all rows so far)
+    """
+    if out is None:
+        out = np.empty((data.shape[0],len(Strides)),dtype=np.float32)
+    if data.shape[0] == 0:
+        return out
+    # moving averages from prefix sums of close prices
+    # accumulate in float64, relative to the first close,
+    # so the sums stay small and differences don't lose digits
+    Shift = np.float64(data[0,1])
+    PrefixSum = np.zeros(data.shape[0]+1)
+    np.cumsum(data[:,1]-Shift,dtype=np.float64,out=PrefixSum[1:])
+    Rows = np.arange(1,data.shape[0]+1)
+    for j,Interval in enumerate(Strides):
+        First = np.maximum(Rows-Interval,0)
+        Average = Shift + (PrefixSum[Rows]-PrefixSum[First]) / (Rows-First)
+        np.log(data[:,PriceIndex]/Average,out=out[:,j])
+    return out
+
+
+
+
+
+
 def FeatureVolume(data,Interval,LongInterval):
     """ get time series of normalized trading volume
     Arguments:
@@ -385,7 +754,78 @@ def FeatureVolume(data,Interval,LongInterval):
 
 
 
-def GenerateFeatureSeries(Cleaned,FeatureParams=None):
+def FeatureVolumeBlock(data,Intervals,LongIntervals,out=None,Filters=None):
+    """ get time series of normalized trading volume, all intervals
+    Arguments:
+    - data -- cleaned data, np.array of np.float32, size (K,6)
+      same layout as for FeatureVolume
+    - Intervals -- how far back for each short EMA,
+        e.g. FeatureParameters.VolumeIntervals
+    - LongIntervals -- how far back for the long EMA
+        paired with each entry of Intervals
+    - out -- optional np.array, size (K,len(Intervals)), to write into
+    - Filters -- optional np.array of np.float64, size (2*len(Intervals))
+        short EMAs then long EMAs before the first row,
+        updated in place to the values after the last row
+        (default is to start every filter at data[0,5])
+
+    Return Value:
+    - np.array of np.float32, size (K,len(Intervals))
+      out[:,j] is FeatureVolume(data,Intervals[j],LongIntervals[j])
+    """
+    if out is None:
+        out = np.empty((data.shape[0],len(Intervals)),dtype=np.float32)
+    if data.shape[0] == 0:
+        return out
+    if Filters is None:
+        Filters = np.full(2*len(Intervals),data[0,5],dtype=np.float64)
+    Rates = 1.0/np.concatenate([Intervals,LongIntervals]).astype(np.float64)
+    _VolumeFilterBank(data[:,5],Rates,Filters,out)
+    return out
+
+
+
+
+
+
+@jit
+def _VolumeFilterBank(Volume,Rates,Filters,out):
+    # all short and long filters advance together,
+    # one pass over the volume column
+    NumIntervals = out.shape[1]
+    for i in range(Volume.shape[0]):
+        for k in range(2*NumIntervals):
+            Filters[k] += Rates[k]*(Volume[i]-Filters[k])
+        for k in range(NumIntervals):
+            out[i,k] = Filters[k]/(Filters[NumIntervals+k]+1)
+
+
+
+
+
+
+def NumFeatures(FeatureParams):
+    """Number of columns in a feature series made with FeatureParams"""
+    return (6 + 4*len(FeatureParams.StridesLPR)
+        + len(FeatureParams.StridesSMA)
+        + len(FeatureParams.VolumeIntervals))
+
+
+
+
+
+
+def ContextLength(FeatureParams):
+    """Number of preceding rows of cleaned data that the rolling
+    features for one row depend on (besides the volume EMAs)"""
+    return max(list(FeatureParams.StridesLPR)+list(FeatureParams.StridesSMA))
+
+
+
+
+
+
+def GenerateFeatureSeries(Cleaned,FeatureParams=None,out=None,State=None):
     """Create a time series of features from a cleaned dataset
 
     Arguments:
@@ -405,8 +845,20 @@ def GenerateFeatureSeries(Cleaned,FeatureParams=None):
       - period -- integer number of minutes per aggregated trading period
       - IntervalsPerDay
       - NumDays
+    - FeatureParams -- instance of FeatureParameters
+    - out -- optional np.array of np.float32, size (K,NumFeatures(FeatureParams))
+      e.g. an np.memmap of the output file, written column block
+      by column block instead of allocating the result
+    - State -- optional instance of FeatureState, from a previous
+      call on the data that came just before Cleaned.data
+      * the result is then the continuation of that series,
+        as if it had been generated in one go
 
     Return Value:
+    - instance of FeatureData, with data of np.float32, size (K,F)
+      * F = NumFeatures(FeatureParams)
+      * data is out, if given
+      * State is a FeatureState for continuing after the last row
 
     List of Features:
     - note - LPR = log price relative
@@ -429,18 +881,49 @@ def GenerateFeatureSeries(Cleaned,FeatureParams=None):
     RetVal.IntervalsPerDay = Cleaned.IntervalsPerDay
     RetVal.NumDays = Cleaned.NumDays
     RetVal.period = Cleaned.period
-    RetVal.data = np.transpose(np.array([]
-        +[Cleaned.data[:,i]
-            for i in range(6)]
-        +[FeatureLPR(Cleaned.data,PriceIndex,Interval)
-            for PriceIndex in range(1,5)
-            for Interval in FeatureParams.StridesLPR]
-        +[FeatureAverageLPR(Cleaned.data,PriceIndex,Interval)
-            for PriceIndex in [1]
-            for Interval in FeatureParams.StridesSMA]
-        +[FeatureVolume(Cleaned.data,Interval,max(Interval*10,Cleaned.IntervalsPerDay*20))
-            for Interval in FeatureParams.VolumeIntervals]
-        ))
+
+    NumStridesLPR = len(FeatureParams.StridesLPR)
+    NumStridesSMA = len(FeatureParams.StridesSMA)
+    LPRsStart = 6
+    SMAsStart = LPRsStart + 4*NumStridesLPR
+    VolStart  = SMAsStart + NumStridesSMA
+    if out is None:
+        out = np.empty((Cleaned.data.shape[0],NumFeatures(FeatureParams)),
+            dtype=np.float32)
+
+    # rolling LPRs and SMAs look back over the preceding rows
+    if State is None:
+        Data = Cleaned.data
+        Filters = None
+        if Data.shape[0] > 0:
+            Filters = np.full(2*len(FeatureParams.VolumeIntervals),
+                Data[0,5],dtype=np.float64)
+    else:
+        Data = np.concatenate([State.Context,Cleaned.data])
+        Filters = State.Filters.copy()
+    Skip = Data.shape[0] - Cleaned.data.shape[0]
+    if Skip == 0:
+        Work = out
+    else:
+        Work = np.empty((Data.shape[0],VolStart),dtype=np.float32)
+
+    # each kernel writes straight into its own columns
+    out[:,:LPRsStart] = Cleaned.data
+    FeatureLPRBlock(Data,FeatureParams.StridesLPR,
+        out=Work[:,LPRsStart:SMAsStart])
+    FeatureAverageLPRBlock(Data,FeatureParams.StridesSMA,
+        out=Work[:,SMAsStart:VolStart])
+    if Skip > 0:
+        out[:,LPRsStart:VolStart] = Work[Skip:,LPRsStart:VolStart]
+    FeatureVolumeBlock(Cleaned.data,FeatureParams.VolumeIntervals,
+        [max(Interval*10,Cleaned.IntervalsPerDay*20)
+            for Interval in FeatureParams.VolumeIntervals],
+        out=out[:,VolStart:],Filters=Filters)
+
+    RetVal.State = FeatureState()
+    RetVal.State.Context = Data[-ContextLength(FeatureParams):].copy()
+    RetVal.State.Filters = Filters
+    RetVal.data = out
     return RetVal
 
 
@@ -455,8 +938,13 @@ def GenerateFeatureSeries(Cleaned,FeatureParams=None):
 
 # This is just for debugging the functionality provide in this file
 def main():
-    data = np.fromfile('composite/NFLX.dat',dtype=np.float64)
-    data.shape = (data.shape[0]//6,6)
+    # e.g. 30 to only load the most recent 30 trading days
+    NumDaysToShow = None
+    if NumDaysToShow is None:
+        data = ReadComposite('composite/NFLX.dat')
+        DayStarts = None
+    else:
+        data,DayStarts = ReadCompositeDays('composite/NFLX.dat',-NumDaysToShow)
     # data[:,0] is unix times, start of the interval
     # data[:,1] is close price, dollars
     # data[:,2] is high price, dollars
@@ -464,7 +952,7 @@ def main():
     # data[:,4] is open price, dollars
     # data[:,5] is share unit volume
 
-    AggregatedData = AggregateData(data,2)
+    AggregatedData = AggregateDataVectorized(data,2,DayStarts=DayStarts)
     StockFeatures = GenerateFeatureSeries(AggregatedData)
 
     print("IntervalsPerDay = " + str(AggregatedData.IntervalsPerDay))
@@ -25,28 +25,181 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import glob
+import os
+import json
+import hashlib
 import aggregate as ag
+import file_hash as fh
 from multiprocessing import Process
 from multiprocessing import Pool
 import time
 
+# integer number of minutes per aggregated trading period
+period = 2
+
+def FeatureFileNames(FName):
+    """features/<SYM>.float32 and features/<SYM>.state
+    for the composite file FName = composite/<SYM>.dat"""
+    # take off 'composite'
+    OutName = FName[9:]
+    # add 'features', take off '.dat'
+    OutName = 'features' + OutName[:-4]
+    return OutName + '.float32', OutName + '.state'
+
+
+def CompositeFileName(sym):
+    if sym[0] == '.':
+        return 'composite/' + sym[1:] + '.dat'
+    return 'composite/' + sym + '.dat'
+
+
+# what each feature file was made from, see NeedToDo
+ManifestName = 'features/manifest.json'
+
+def LoadManifest():
+    """{'params': FeatureParamsHash, 'inputs': {FName: InputRecord}}"""
+    if not os.path.exists(ManifestName):
+        return {'params':None,'inputs':{}}
+    with open(ManifestName) as f:
+        return json.load(f)
+
+
+def SaveManifest(Manifest):
+    with open(ManifestName+'.tmp','w') as f:
+        json.dump(Manifest,f,indent=1,sort_keys=True)
+    os.replace(ManifestName+'.tmp',ManifestName)
+
+
+def FeatureParamsHash(FeatureParams):
+    """hash of everything that determines the feature values"""
+    Description = json.dumps({
+        'period':period,
+        'StridesLPR':[int(x) for x in FeatureParams.StridesLPR],
+        'StridesSMA':[int(x) for x in FeatureParams.StridesSMA],
+        'VolumeIntervals':[int(x) for x in FeatureParams.VolumeIntervals],
+        },sort_keys=True)
+    return hashlib.sha1(Description.encode('ascii')).hexdigest()
+
+
+def InputRecord(Stat,data):
+    """size, modification time and content hash of a composite file
+    - Stat -- os.stat() of the file, from before it was read
+    - data -- full contents of the file"""
+    return {
+        'size':Stat.st_size,
+        'mtime':Stat.st_mtime,
+        'sha1':hashlib.sha1(np.ascontiguousarray(data)).hexdigest(),
+        }
+
+
+def SaveState(StateName,NumRawRows,State):
+    # raw rows consumed, then volume EMA filters
+    np.concatenate([[NumRawRows],State.Filters]).astype(np.float64).tofile(StateName)
+
+
 def ProcessFile(FName):
+    """Generate the features for composite file FName from scratch
+    Returns FName and its InputRecord, for the manifest"""
     print(FName)
-    data = np.fromfile(FName,dtype=np.float64)
-    data.shape = (data.shape[0]//6,6)
+    Stat = os.stat(FName)
+    data = ag.ReadComposite(FName)
 
     # clean up the data set
-    Cleaned = ag.AggregateData(data,2)
+    DayStarts = ag.ReadDayIndex(FName,data)
+    Cleaned = ag.AggregateDataVectorized(data,period,DayStarts=DayStarts)
     # construct parameters for feature generation
     FeatureParams = MakeFeatureParams(Cleaned.IntervalsPerDay)
 
-    SequentialFeatures = ag.GenerateFeatureSeries(Cleaned,FeatureParams)
-    # take off 'composite'
-    OutName = FName[9:]
-    # add 'features', take off '.dat', add '.float32'
-    OutName = 'features' + OutName[:-4] + '.float32'
+    OutName,StateName = FeatureFileNames(FName)
     print(OutName)
-    SequentialFeatures.data.astype(np.float32).tofile(OutName)
+    if Cleaned.data.shape[0] == 0:
+        # nothing to map, just leave an empty file
+        open(OutName,'wb').close()
+        return FName,InputRecord(Stat,data)
+    # features are written straight into the output file
+    Output = np.memmap(OutName,dtype=np.float32,mode='w+',
+        shape=(Cleaned.data.shape[0],ag.NumFeatures(FeatureParams)))
+    SequentialFeatures = ag.GenerateFeatureSeries(Cleaned,FeatureParams,out=Output)
+    Output.flush()
+    del Output
+    SaveState(StateName,data.shape[0],SequentialFeatures.State)
+    return FName,InputRecord(Stat,data)
+
+
+def UpdateFile(FName,KnownSha1=None):
+    """Append features for the trading days added to FName since
+    the feature file was made, carrying the rolling state forward.
+    KnownSha1 is the manifest hash of FName when the features were made.
+    Falls back to ProcessFile when the existing features can't
+    be continued: missing state or KnownSha1, a partial day, or any
+    change to the raw rows already used (checked against KnownSha1;
+    the last day is also recomputed and compared to the feature file).
+    Returns FName and its InputRecord, for the manifest"""
+    OutName,StateName = FeatureFileNames(FName)
+    if not (os.path.exists(OutName) and os.path.exists(StateName)):
+        return ProcessFile(FName)
+    print(FName)
+    Stat = os.stat(FName)
+    data = ag.ReadComposite(FName)
+
+    IntervalsPerDay = int(np.ceil(6.5*60/period))
+    FeatureParams = MakeFeatureParams(IntervalsPerDay)
+    TotalFeatures = ag.NumFeatures(FeatureParams)
+    State = np.fromfile(StateName,dtype=np.float64)
+    NumRawRows = int(State[0])
+    ExistingRows = os.path.getsize(OutName)//(4*TotalFeatures)
+    ExistingDays = ExistingRows//IntervalsPerDay
+    DayStarts = ag.ReadDayIndex(FName,data)
+
+    # the composite file must be what the features were made
+    # from, followed by whole new trading days
+    if (len(State) != 1+2*len(FeatureParams.VolumeIntervals)
+            or ExistingDays == 0
+            or os.path.getsize(OutName) != 4*TotalFeatures*ExistingDays*IntervalsPerDay
+            or len(DayStarts) < ExistingDays
+            or data.shape[0] < NumRawRows
+            or (len(DayStarts) > ExistingDays and DayStarts[ExistingDays] != NumRawRows)
+            or (len(DayStarts) == ExistingDays and data.shape[0] != NumRawRows)):
+        print('can not continue features, starting over')
+        return ProcessFile(FName)
+    # the rows the features were made from must not have changed
+    # (the manifest sha1 is of the whole file as it was then)
+    if KnownSha1 is None:
+        print('no record of the old raw data, starting over')
+        return ProcessFile(FName)
+    if hashlib.sha1(np.ascontiguousarray(data[:NumRawRows])).hexdigest() != KnownSha1:
+        print('raw data changed, starting over')
+        return ProcessFile(FName)
+    if len(DayStarts) == ExistingDays:
+        print('no new days')
+        return FName,InputRecord(Stat,data)
+
+    Existing = np.memmap(OutName,dtype=np.float32,mode='r',
+        shape=(ExistingRows,TotalFeatures))
+    # redo the last known day, as a check on the old raw data
+    Cleaned = ag.AggregateDataVectorized(data,period,
+        FirstDay=ExistingDays-1,DayStarts=DayStarts)
+    if not np.array_equal(Cleaned.data[:IntervalsPerDay],Existing[-IntervalsPerDay:,:6]):
+        del Existing
+        print('raw data changed, starting over')
+        return ProcessFile(FName)
+    Cleaned.data = Cleaned.data[IntervalsPerDay:]
+    Cleaned.NumDays -= 1
+    Cleaned.FirstDay += 1
+
+    # cleaned data columns of the feature file are the context
+    PrevState = ag.FeatureState()
+    PrevState.Context = np.array(Existing[-ag.ContextLength(FeatureParams):,:6])
+    PrevState.Filters = State[1:]
+    del Existing
+
+    SequentialFeatures = ag.GenerateFeatureSeries(Cleaned,FeatureParams,State=PrevState)
+    with open(OutName,'r+b') as f:
+        f.seek(4*TotalFeatures*ExistingRows)
+        SequentialFeatures.data.tofile(f)
+    SaveState(StateName,data.shape[0],SequentialFeatures.State)
+    print(OutName,'added',Cleaned.NumDays,'days')
+    return FName,InputRecord(Stat,data)
 
 
 def MakeFeatureParams(IntervalsPerDay):
@@ -91,10 +244,22 @@ def MakeFeatureParams(IntervalsPerDay):
 
 
 
-def NeedToDo():
-    ExistingFileNames = glob.glob("features/*.float32")
-    ExistingFileNames = [ (x[9:]) for x in ExistingFileNames]
-    ExistingFileNames = [ (x[:-8]) for x in ExistingFileNames]
+def NeedToDo(Manifest,ParamsHash):
+    """Symbols whose feature files are missing or stale
+
+    Arguments:
+    - Manifest -- from LoadManifest(), entries for composite files
+      that were only touched (same contents) are refreshed in place
+    - ParamsHash -- FeatureParamsHash() of the current parameters
+
+    Return Value:
+    - sorted list of symbols
+    - Rebuild -- True if the parameters changed, so every symbol
+      is listed and has to be recomputed from scratch
+    """
+    Rebuild = Manifest['params'] != ParamsHash
+    if Rebuild:
+        print('feature parameters changed, recomputing everything')
 
     SymbolsList = [
         # Large Cap Stock Symbols (over $10B)
@@ -131,7 +296,25 @@ def NeedToDo():
         "WYN","WYNN","X","XEC","XEL","XL","XLNX","XOM","XRAY","XRX","XYL","YELP","YUM","Z","ZION","ZNGA","ZTS",
     ]
     print('len(SymbolsList) =',len(SymbolsList))
-    return sorted(list(set(SymbolsList)-set(ExistingFileNames)))
+
+    ToDo = []
+    for sym in sorted(list(set(SymbolsList))):
+        FName = CompositeFileName(sym)
+        if not os.path.exists(FName):
+            continue
+        Known = Manifest['inputs'].get(FName)
+        if Rebuild or Known is None or not os.path.exists(FeatureFileNames(FName)[0]):
+            ToDo.append(sym)
+            continue
+        Stat = os.stat(FName)
+        if Stat.st_size == Known['size'] and Stat.st_mtime == Known['mtime']:
+            continue
+        # file was written, check if the contents actually changed
+        if Stat.st_size == Known['size'] and fh.FileHash(FName) == Known['sha1']:
+            Known['mtime'] = Stat.st_mtime
+            continue
+        ToDo.append(sym)
+    return ToDo,Rebuild
 
 
 
@@ -140,21 +323,34 @@ def NeedToDo():
 
 def main():
 
+    # extend existing feature files with newly collected days
+    Incremental = True
+
+    IntervalsPerDay = int(np.ceil(6.5*60/period))
+    ParamsHash = FeatureParamsHash(MakeFeatureParams(IntervalsPerDay))
+    Manifest = LoadManifest()
+
     # FileNames = glob.glob("composite/*.dat")
-    SymbolsList = NeedToDo()
+    SymbolsList,Rebuild = NeedToDo(Manifest,ParamsHash)
 
     T0 = time.time()
 
-    FileNames = []
-    for sym in SymbolsList:
-        FileName = 'composite/' + sym + '.dat'
-        if(sym[0]=='.'):
-            FileName = 'composite/' + sym[1:] + '.dat'
-        FileNames.append(FileName)
-
+    FileNames = [CompositeFileName(sym) for sym in SymbolsList]
 
     p = Pool(16)
-    p.map(ProcessFile, FileNames)
+    if Incremental and not Rebuild:
+        # with the hash of the data the existing features were made from
+        Records = p.starmap(UpdateFile, [(FName,Manifest['inputs'].get(FName,{}).get('sha1'))
+            for FName in FileNames])
+    else:
+        Records = p.map(ProcessFile, FileNames)
+
+    if Rebuild:
+        Manifest['inputs'] = {}
+    for FName,Record in Records:
+        Manifest['inputs'][FName] = Record
+    Manifest['params'] = ParamsHash
+    SaveManifest(Manifest)
 
     # for a in FileNames:
     #     ProcessFile(a)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+# MIT License
+
+# Copyright (c) 2018 Andrew J. Bean
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import h5py
+import numpy as np
+import os
+import time
+import combine_data as cd
+import feature_store as fs
+
+
+def main():
+    # compare read throughput of storage layouts for the combined features
+    # run after combine_data.py; the first symbols are rewritten to a
+    # scratch file in each layout
+    NumSymbols = 20
+    ScratchName = "benchmark_features_scratch.hdf5"
+    AllDataFile = fs.OpenFeatureFile(fs.FeaturesName)
+    AllSymbols = [n.decode('UTF-8') for n in AllDataFile['AllSymbols']][:NumSymbols]
+    IntervalsPerDay = fs.SymbolInfo(AllSymbols[0])['IntervalsPerDay']
+
+    # (description, ChunkDays, ChunkColumns, Compression)
+    Layouts = [
+        ('contiguous',             None, None, None),
+        ('5 days x all',              5, None, None),
+        ('5 days x all, lzf',         5, None, 'lzf'),
+        ('5 days x all, gzip',        5, None, 'gzip'),
+        ('5 days x all, blosc',       5, None, 'blosc'),
+        ('20 days x 1 column',       20,    1, None),
+        ('20 days x 1 column, lzf',  20,    1, 'lzf'),
+    ]
+    print('%-26s %10s %14s %14s %14s' % ('layout','MB on disk','full MB/s','range MB/s','column MB/s'))
+    for Description,ChunkDays,ChunkColumns,Compression in Layouts:
+        Scratch = h5py.File(ScratchName, "w")
+        for sym in AllSymbols:
+            cd.CreateSymbolDataset(Scratch, sym, AllDataFile[sym][:],
+                ChunkRows=None if ChunkDays is None else ChunkDays*IntervalsPerDay,
+                ChunkColumns=ChunkColumns,
+                Compression=Compression)
+        Scratch.close()
+        Size = os.path.getsize(ScratchName)
+        Scratch = h5py.File(ScratchName, "r")
+        Rates = BenchmarkReads(Scratch,AllSymbols,IntervalsPerDay)
+        Scratch.close()
+        print('%-26s %10.1f %14.1f %14.1f %14.1f' % ((Description,Size/2**20)+Rates))
+    os.remove(ScratchName)
+
+
+def BenchmarkReads(File,Symbols,IntervalsPerDay,NumRanges=20,RangeDays=5,Column=6,Seed=0):
+    '''BenchmarkReads(File,Symbols,IntervalsPerDay,NumRanges,RangeDays,Column,Seed)
+    read throughput, in MB/s of uncompressed features, for three access patterns
+
+    Arguments:
+    - File -- h5py.File() with one data set per symbol
+    - Symbols -- symbols to read
+    - IntervalsPerDay -- rows per trading day
+    - NumRanges -- number of date ranges read per symbol
+    - RangeDays -- length of each date range, in days
+    - Column -- feature read for the single column test
+
+    Return Value:
+    - (full symbol, date range, single column) MB/s
+
+    Notes:
+    - files are read back right after they are written, so they are
+      likely in the OS page cache; this compares layouts and filters,
+      not disk speed
+    '''
+    Random = np.random.RandomState(Seed)
+    Rates = []
+    for Pattern in ['full','range','column']:
+        Bytes = 0
+        T0 = time.time()
+        for sym in Symbols:
+            Data = File[sym]
+            Rows = Data.shape[0]
+            if Pattern == 'full':
+                Block = Data[:]
+            elif Pattern == 'range':
+                Length = min(Rows,RangeDays*IntervalsPerDay)
+                for Start in Random.randint(0,Rows-Length+1,NumRanges):
+                    Block = Data[Start:Start+Length]
+                    Bytes += Block.nbytes
+                continue
+            else:
+                Block = Data[:,Column]
+            Bytes += Block.nbytes
+        Rates.append(Bytes/2**20/max(time.time()-T0,1e-9))
+    return tuple(Rates)
+
+
+if __name__ == '__main__':
+    main()
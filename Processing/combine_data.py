@@ -25,8 +25,15 @@
 import h5py
 import numpy as np
 import glob
+import warnings
 import aggregate as ag
 
+# Blosc needs the optional hdf5plugin package, everything else is built in
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
 
 def MakeFeatureParams(IntervalsPerDay):
     FeatureParams = ag.FeatureParameters(IntervalsPerDay)
@@ -68,6 +75,136 @@ def MakeFeatureParams(IntervalsPerDay):
     return FeatureParams
 
 
+def CompressionOptions(Compression=None):
+    '''CompressionOptions(Compression)
+    keyword arguments for h5py create_dataset
+
+    Arguments:
+    - Compression -- None, 'lzf', 'gzip' or 'blosc'
+      ('blosc' falls back to 'lzf' if hdf5plugin is not installed)
+    '''
+    if Compression is None:
+        return {}
+    if Compression == 'blosc':
+        if hdf5plugin is not None:
+            return dict(hdf5plugin.Blosc(cname='lz4',clevel=5,shuffle=hdf5plugin.Blosc.SHUFFLE))
+        warnings.warn('hdf5plugin not available, using lzf instead of blosc')
+        Compression = 'lzf'
+    if Compression == 'lzf':
+        return {'compression':'lzf', 'shuffle':True}
+    if Compression == 'gzip':
+        return {'compression':'gzip', 'compression_opts':4, 'shuffle':True}
+    raise ValueError('unknown compression '+str(Compression))
+
+
+def CreateSymbolDataset(File,Name,data,ChunkRows=None,ChunkColumns=None,Compression=None):
+    '''CreateSymbolDataset(File,Name,data,ChunkRows,ChunkColumns,Compression)
+    write the features of one symbol
+
+    Arguments:
+    - File -- h5py.File(), open for writing
+    - Name -- name of the data set (stock symbol)
+    - data -- numpy array, size (time,features)
+    - ChunkRows -- rows (time) per chunk, None for a contiguous data set
+    - ChunkColumns -- features per chunk, None for all features
+      (e.g. 1 for column-major chunks, good for reading single features)
+    - Compression -- as for CompressionOptions, needs ChunkRows
+
+    Return Value:
+    - the h5py data set
+    '''
+    if ChunkRows is None:
+        if Compression is not None:
+            raise ValueError('compression needs chunked storage, set ChunkRows')
+        return File.create_dataset(Name, data=data)
+    if ChunkColumns is None:
+        ChunkColumns = data.shape[1]
+    Chunks = (max(1,min(ChunkRows,data.shape[0])), max(1,min(ChunkColumns,data.shape[1])))
+    return File.create_dataset(Name, data=data, chunks=Chunks,
+        **CompressionOptions(Compression))
+
+
+def PanelDays(FileNames,NumFeatures,IntervalsPerDay):
+    '''PanelDays(FileNames,NumFeatures,IntervalsPerDay)
+    common grid of trading days for a panel of symbols
+
+    Arguments:
+    - FileNames -- feature files (float32) from allfeatures.py, one per symbol
+    - NumFeatures -- features per time step
+    - IntervalsPerDay -- time steps per trading day
+
+    Return Values:
+    - Days -- sorted numpy array of every day (floor of the timestamp
+      at the start of the day) that any symbol has
+    - Positions -- list with, for each symbol, the position in Days
+      of each of its days
+    '''
+    SymbolDays = []
+    for FName in FileNames:
+        data = np.memmap(FName,dtype=np.float32,mode='r')
+        data = data[:(data.shape[0]//NumFeatures)*NumFeatures].reshape(-1,NumFeatures)
+        NumDays = data.shape[0]//IntervalsPerDay
+        SymbolDays.append(np.floor(data[:NumDays*IntervalsPerDay:IntervalsPerDay,0]).astype(np.int64))
+        del data
+    Days = np.unique(np.concatenate(SymbolDays)) if SymbolDays else np.zeros(0,dtype=np.int64)
+    Positions = [np.searchsorted(Days,d) for d in SymbolDays]
+    return Days, Positions
+
+
+def WritePanel(File,FileNames,NumFeatures,IntervalsPerDay,ChunkIntervals=5,MemoryBudget=2**28):
+    '''WritePanel(File,FileNames,NumFeatures,IntervalsPerDay,ChunkIntervals,MemoryBudget)
+    write all symbols as one panel aligned in time
+
+    Arguments:
+    - File -- h5py.File(), open for writing
+    - FileNames -- feature files (float32) from allfeatures.py, one per symbol
+    - NumFeatures -- features per time step
+    - IntervalsPerDay -- time steps per trading day
+    - ChunkIntervals -- time steps per chunk; each chunk holds all symbols
+    - MemoryBudget -- bytes of the panel to hold in RAM at once
+
+    Result:
+    - File['Panel'] -- size (symbols, days*IntervalsPerDay, features),
+      Panel[s,d*IntervalsPerDay+i,:] is time step i of File['Days'][d]
+      for symbol s (in the order of FileNames), NaN where not Valid
+    - File['Valid'] -- bool, size (symbols, days), whether the symbol
+      has data for the day (False e.g. before it was listed)
+    - File['Days'] -- the day grid, see PanelDays
+
+    Notes:
+    - all symbols at one time step, Panel[:,t,:], are in one chunk
+    - the panel is written in blocks of whole days across all symbols,
+      so each chunk is written once (twice if it straddles two blocks)
+    '''
+    NumSymbols = len(FileNames)
+    Days, Positions = PanelDays(FileNames,NumFeatures,IntervalsPerDay)
+    Valid = np.zeros((NumSymbols,len(Days)),dtype=bool)
+    for s in range(NumSymbols):
+        Valid[s,Positions[s]] = True
+    File.create_dataset('Days', data=Days)
+    File.create_dataset('Valid', data=Valid)
+    Panel = File.create_dataset('Panel',
+        (NumSymbols,len(Days)*IntervalsPerDay,NumFeatures),dtype=np.float32,
+        chunks=(max(1,NumSymbols),ChunkIntervals,NumFeatures),fillvalue=np.nan)
+
+    DayBytes = NumSymbols*IntervalsPerDay*NumFeatures*4
+    BlockDays = max(1,MemoryBudget//DayBytes)
+    for Start in range(0,len(Days),BlockDays):
+        Stop = min(Start+BlockDays,len(Days))
+        print('panel days',Start,'to',Stop,'of',len(Days))
+        Block = np.full((NumSymbols,(Stop-Start)*IntervalsPerDay,NumFeatures),np.nan,dtype=np.float32)
+        for s,FName in enumerate(FileNames):
+            # this symbol's days in the block are a contiguous range of its rows
+            First,Last = np.searchsorted(Positions[s],[Start,Stop])
+            if First == Last:
+                continue
+            data = np.fromfile(FName,dtype=np.float32,
+                count=(Last-First)*IntervalsPerDay*NumFeatures,
+                offset=First*IntervalsPerDay*NumFeatures*4)
+            data.shape = (Last-First,IntervalsPerDay,NumFeatures)
+            Block.reshape(NumSymbols,Stop-Start,IntervalsPerDay,NumFeatures)[
+                s,Positions[s][First:Last]-Start] = data
+        Panel[:,Start*IntervalsPerDay:Stop*IntervalsPerDay,:] = Block
 
 
 def main():
@@ -76,6 +213,17 @@ def main():
     period = 2
     IntervalsPerDay = int(6.5 * 60 / 2)
     FeatureParams = MakeFeatureParams(IntervalsPerDay)
+    # each chunk holds ChunkDays of all features (or ChunkColumns of them)
+    # None for contiguous data sets
+    # see benchmark_features.py for comparing layouts; when the file
+    # fits in the page cache, contiguous and uncompressed reads fastest
+    ChunkDays = None
+    ChunkColumns = None
+    # None, 'lzf', 'gzip', or 'blosc' (needs hdf5plugin and ChunkDays)
+    Compression = None
+    # also write all symbols as one (symbols, time, features) panel,
+    # aligned on a common grid of trading days, see WritePanel
+    Panel = False
 
     AllDataFile = h5py.File("2min_aggregated_features.hdf5", "w")
 
@@ -96,20 +244,31 @@ def main():
         # read in the data from the file
         data = np.fromfile(FName,dtype=np.float32)
         # 81 features total
-        TotalFeatures = (
-            6 + 4*len(FeatureParams.StridesLPR)
-            + len(FeatureParams.StridesSMA)
-            + len(FeatureParams.VolumeIntervals))
+        TotalFeatures = ag.NumFeatures(FeatureParams)
         data.shape = (data.shape[0]//TotalFeatures,TotalFeatures)
         # put into HDF5 database
-        # compression doesn't help much
-        # but does make dataset creation much slower
-        # dset = AllDataFile.create_dataset(SymbolString, data=data, compression="gzip", compression_opts=9)
-        dset = AllDataFile.create_dataset(SymbolString, data=data)
+        # gzip level 9 doesn't help much
+        # but does make dataset creation much slower; lzf is fast
+        dset = CreateSymbolDataset(AllDataFile, SymbolString, data,
+            ChunkRows=None if ChunkDays is None else ChunkDays*IntervalsPerDay,
+            ChunkColumns=ChunkColumns,
+            Compression=Compression)
         dset.attrs['period'] = period
         dset.attrs['IntervalsPerDay'] = IntervalsPerDay
         dset.attrs['NumDays'] = data.shape[0]//IntervalsPerDay
 
+    if Panel:
+        PanelFile = h5py.File("2min_aggregated_panel.hdf5", "w")
+        grp = PanelFile.create_group("FeatureParams")
+        dset = grp.create_dataset('StridesLPR', data=FeatureParams.StridesLPR)
+        dset = grp.create_dataset('StridesSMA', data=FeatureParams.StridesSMA)
+        dset = grp.create_dataset('VolumeIntervals', data=FeatureParams.VolumeIntervals)
+        PanelFile.create_dataset('AllSymbols', (len(AllSymbols),),'S15', AllSymbols)
+        WritePanel(PanelFile, FileNames, ag.NumFeatures(FeatureParams), IntervalsPerDay)
+        PanelFile.attrs['period'] = period
+        PanelFile.attrs['IntervalsPerDay'] = IntervalsPerDay
+        PanelFile.close()
+
 
 
 
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+# MIT License
+
+# Copyright (c) 2018 Andrew J. Bean
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from keras.utils import Sequence
+
+
+def SplitRanges(NumExamples):
+    '''SplitRanges(NumExamples)
+    chronological split of examples sorted by time
+
+    Return Values:
+    - StartVal, StartTest -- training set is [0,StartVal), validation set is
+      [StartVal,StartTest), test set is [StartTest,NumExamples)
+      (80%, 10%, 10%)
+    '''
+    StartTest = int(0.9*NumExamples)
+    StartVal = int(0.8*NumExamples)
+    return StartVal, StartTest
+
+
+class BatchLoader:
+    '''BatchLoader(Datasets,MaxRows,NumInFlight,NumThreads)
+    reads row ranges of several h5py data sets ahead of time in a thread
+    pool, into a ring of preallocated buffers
+
+    Arguments:
+    - Datasets -- list of h5py data sets with the same number of rows
+      (e.g. Features, Outcomes, Timestamps)
+    - MaxRows -- most rows in one range
+    - NumInFlight -- ranges being read ahead while one is in use
+    - NumThreads -- reader threads
+
+    Notes:
+    - arrays given out by Load are views of the ring buffers, valid
+      until the next range is requested; copy them to keep them
+    - Stats/Report tell whether the consumer waits on reads (stall)
+      or reads wait on the consumer (compute)
+    '''
+    def __init__(self,Datasets,MaxRows,NumInFlight=4,NumThreads=2):
+        self.Datasets = list(Datasets)
+        self.MaxRows = MaxRows
+        self.NumInFlight = NumInFlight
+        # one more slot than in flight, for the range in use
+        self.Buffers = [[np.empty((MaxRows,)+d.shape[1:],dtype=d.dtype) for d in self.Datasets]
+            for i in range(NumInFlight+1)]
+        self.Pool = ThreadPoolExecutor(max_workers=NumThreads)
+        self.Lock = threading.Lock()
+        self.ReadTime = 0.0
+        self.StallTime = 0.0
+        self.ComputeTime = 0.0
+        self.RowsRead = 0
+
+    def _Read(self,Slot,Start,Stop):
+        T0 = time.time()
+        Out = []
+        for d,Buffer in zip(self.Datasets,self.Buffers[Slot]):
+            if Stop > Start:
+                d.read_direct(Buffer,np.s_[Start:Stop],np.s_[0:Stop-Start])
+            Out.append(Buffer[:Stop-Start])
+        with self.Lock:
+            self.ReadTime += time.time()-T0
+            self.RowsRead += Stop-Start
+        return tuple(Out)
+
+    def Load(self,Ranges):
+        '''Load(Ranges)
+        generator of a tuple of arrays, one per data set, for each
+        (Start,Stop) in Ranges, in order; None items are passed through
+        (e.g. to mark the end of an epoch in an endless Ranges)
+        '''
+        Ranges = iter(Ranges)
+        InFlight = []
+        Slot = 0
+        Exhausted = False
+        while True:
+            # keep NumInFlight ranges submitted
+            while not Exhausted and len(InFlight) < self.NumInFlight:
+                try:
+                    Range = next(Ranges)
+                except StopIteration:
+                    Exhausted = True
+                    break
+                if Range is None:
+                    InFlight.append(None)
+                    continue
+                if Range[1]-Range[0] > self.MaxRows:
+                    raise ValueError('range longer than MaxRows')
+                InFlight.append(self.Pool.submit(self._Read,Slot,Range[0],Range[1]))
+                Slot = (Slot+1)%len(self.Buffers)
+            if not InFlight:
+                return
+            Next = InFlight.pop(0)
+            T0 = time.time()
+            Result = None if Next is None else Next.result()
+            T1 = time.time()
+            self.StallTime += T1-T0
+            yield Result
+            self.ComputeTime += time.time()-T1
+
+    def Stats(self):
+        '''dict of seconds spent reading (summed over threads), stalled
+        waiting for reads, and in the consumer, plus rows read'''
+        return {'read':self.ReadTime, 'stall':self.StallTime,
+            'compute':self.ComputeTime, 'rows':self.RowsRead}
+
+    def Report(self):
+        '''one line summary of Stats'''
+        Total = max(self.StallTime+self.ComputeTime,1e-9)
+        return ('read %.1f s, stalled %.1f s, compute %.1f s, %.0f%% of the time waiting on I/O'
+            % (self.ReadTime,self.StallTime,self.ComputeTime,100.0*self.StallTime/Total))
+
+    def close(self):
+        self.Pool.shutdown(wait=True)
+
+
+class OrderedExamples(Sequence):
+    '''OrderedExamples(ExamplesFile,Start,Stop,BatchSize,Normalization)
+    (Features,Outcomes) batches of a range of examples, in file order,
+    for validation, evaluate_generator and predict_generator
+
+    Arguments:
+    - ExamplesFile -- h5py.File() with 'Features' and 'Outcomes'
+    - Start, Stop -- range of examples to use (see SplitRanges)
+    - BatchSize -- examples per batch
+    - Normalization -- as for ExampleStream
+
+    Notes:
+    - batch i is always examples Start+i*BatchSize to Start+(i+1)*BatchSize,
+      so Keras keeps the batches in order, however far ahead it reads;
+      unlike a generator, nothing it reads ahead is lost between calls
+    - only one batch per read is held, plus what Keras queues
+    '''
+    def __init__(self,ExamplesFile,Start=0,Stop=None,BatchSize=1000,Normalization=None):
+        self.Features = ExamplesFile['Features']
+        self.Outcomes = ExamplesFile['Outcomes']
+        if Stop is None:
+            Stop = self.Features.shape[0]
+        self.Start = Start
+        self.Stop = Stop
+        self.BatchSize = BatchSize
+        self.Normalization = Normalization
+
+    def __len__(self):
+        return (self.Stop-self.Start+self.BatchSize-1)//self.BatchSize
+
+    def __getitem__(self,i):
+        b0 = self.Start+i*self.BatchSize
+        b1 = min(b0+self.BatchSize,self.Stop)
+        x = self.Features[b0:b1]
+        if self.Normalization is not None:
+            x = (x-self.Normalization[0])/self.Normalization[1]
+        return x, self.Outcomes[b0:b1]
+
+
+class ExampleStream:
+    '''ExampleStream(ExamplesFile,Start,Stop,BatchSize,ChunkBytes,BufferChunks,Shuffle,Prefetch,Seed,
+        Normalization)
+    endless stream of (Features,Outcomes) batches from an examples file,
+    for model.fit_generator, without reading the whole range into RAM
+
+    Arguments:
+    - ExamplesFile -- h5py.File() with 'Features' and 'Outcomes'
+    - Start, Stop -- range of examples to use (see SplitRanges)
+    - BatchSize -- examples per batch
+    - ChunkBytes -- size of each contiguous read, rounded to whole examples
+    - BufferChunks -- chunks held in the shuffle buffer at once
+    - Shuffle -- if False, batches are in file order
+    - Prefetch -- chunks read ahead, see BatchLoader;
+      None for 4 with Shuffle, 1 without
+    - Seed -- seed for the chunk order and shuffle buffer
+    - Normalization -- optional (FeatureMean,FeatureStd), see feature_stats.py;
+      features are given out as (Features-FeatureMean)/FeatureStd
+
+    Notes:
+    - each epoch is len(stream) batches and covers every example in
+      [Start,Stop) once; the last batch of an epoch may be short
+    - with Shuffle, chunks are read in random order and examples are
+      shuffled within a buffer of BufferChunks chunks
+    - memory use is about (Prefetch+1+BufferChunks)*ChunkBytes
+    - reads happen in background threads while the model trains;
+      self.Loader.Report() shows whether training waits on them
+    '''
+    def __init__(self,ExamplesFile,Start=0,Stop=None,BatchSize=1000,ChunkBytes=2**25,
+            BufferChunks=4,Shuffle=True,Prefetch=None,Seed=0,Normalization=None):
+        self.Features = ExamplesFile['Features']
+        self.Outcomes = ExamplesFile['Outcomes']
+        if Stop is None:
+            Stop = self.Features.shape[0]
+        self.Start = Start
+        self.Stop = Stop
+        self.BatchSize = BatchSize
+        RowBytes = self.Features.dtype.itemsize*int(np.prod(self.Features.shape[1:]))
+        self.ChunkRows = max(1,ChunkBytes//RowBytes)
+        self.BufferChunks = BufferChunks if Shuffle else 1
+        if Prefetch is None:
+            Prefetch = 4 if Shuffle else 1
+        self.Shuffle = Shuffle
+        self.Random = np.random.RandomState(Seed)
+        self.Normalization = Normalization
+        self.ChunkStarts = np.arange(Start,Stop,self.ChunkRows)
+        self.Loader = BatchLoader([self.Features,self.Outcomes],self.ChunkRows,
+            NumInFlight=Prefetch)
+        self.Batches = self._Batches()
+
+    def __len__(self):
+        return (self.Stop-self.Start+self.BatchSize-1)//self.BatchSize
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.Batches)
+
+    def close(self):
+        '''stop the background reads'''
+        self.Batches.close()
+        self.Loader.close()
+
+    def _Ranges(self):
+        # every chunk of every epoch, in epoch order,
+        # then None to mark the end of the epoch
+        while True:
+            if self.Shuffle:
+                Order = self.Random.permutation(self.ChunkStarts)
+            else:
+                Order = self.ChunkStarts
+            for c in Order:
+                yield (c,min(c+self.ChunkRows,self.Stop))
+            yield None
+
+    def _Batches(self):
+        Chunks = self.Loader.Load(self._Ranges())
+        # one preallocated shuffle buffer: up to BatchSize examples carried
+        # over from the last fill, then BufferChunks chunks; its first
+        # Pending examples are still to be emitted, in the order of Order
+        Capacity = self.BatchSize+self.BufferChunks*self.ChunkRows
+        x = np.empty((Capacity,)+self.Features.shape[1:],dtype=self.Features.dtype)
+        y = np.empty((Capacity,)+self.Outcomes.shape[1:],dtype=self.Outcomes.dtype)
+        Identity = np.arange(Capacity)
+        Order = Identity.copy()
+        Pending = 0
+        EndOfEpoch = False
+        while True:
+            # fill the buffer after what is left from the last fill
+            # chunks are views of the loader's buffers, copy them right away
+            Carried = Pending
+            for NumChunks in range(self.BufferChunks):
+                Chunk = next(Chunks)
+                if Chunk is None:
+                    EndOfEpoch = True
+                    break
+                n = len(Chunk[0])
+                x[Pending:Pending+n] = Chunk[0]
+                y[Pending:Pending+n] = Chunk[1]
+                Pending += n
+            if self.Normalization is not None:
+                # only the new examples, carried ones already are
+                Mean,Std = self.Normalization
+                x[Carried:Pending] -= Mean
+                x[Carried:Pending] /= Std
+            # shuffle the order of the examples, not the examples
+            Order[:Pending] = Identity[:Pending]
+            if self.Shuffle:
+                self.Random.shuffle(Order[:Pending])
+            # emit full batches, keep the rest for the next fill
+            # everything goes out at the end of the epoch
+            Pos = 0
+            while Pending-Pos >= self.BatchSize or (EndOfEpoch and Pos < Pending):
+                Sel = Order[Pos:min(Pos+self.BatchSize,Pending)]
+                yield x[Sel], y[Sel]
+                Pos += self.BatchSize
+            if EndOfEpoch:
+                Pending = 0
+                EndOfEpoch = False
+            else:
+                # fewer than BatchSize left, move them to the front
+                Rest = Order[Pos:Pending]
+                x[:len(Rest)] = x[Rest]
+                y[:len(Rest)] = y[Rest]
+                Pending = len(Rest)
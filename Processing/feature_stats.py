@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+# MIT License
+
+# Copyright (c) 2018 Andrew J. Bean
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import h5py
+import numpy as np
+from multiprocessing import Pool
+
+
+def ChunkMoments(x):
+    '''ChunkMoments(x)
+    per column count, mean and sum of squared deviations of a chunk
+
+    Arguments:
+    - x -- numpy array, size (rows,columns)
+
+    Return Value:
+    - (n, Mean, M2), Mean and M2 float64 arrays, one entry per column
+    '''
+    x = np.asarray(x,dtype=np.float64)
+    n = x.shape[0]
+    if n == 0:
+        return 0, np.zeros(x.shape[1]), np.zeros(x.shape[1])
+    Mean = x.mean(axis=0)
+    M2 = np.sum((x-Mean)**2,axis=0)
+    return n, Mean, M2
+
+
+def MergeMoments(A,B):
+    '''MergeMoments(A,B)
+    combine (n,Mean,M2) of two disjoint sets of rows (Chan et al.)'''
+    nA,MeanA,M2A = A
+    nB,MeanB,M2B = B
+    n = nA+nB
+    if n == 0:
+        return A
+    Delta = MeanB-MeanA
+    Mean = MeanA + Delta*(nB/n)
+    M2 = M2A + M2B + Delta**2*(nA*nB/n)
+    return n, Mean, M2
+
+
+def RangeMoments(Args):
+    '''RangeMoments((ExamplesName,Start,Stop,ChunkRows))
+    (n,Mean,M2) of Features[Start:Stop], read one chunk at a time'''
+    ExamplesName,Start,Stop,ChunkRows = Args
+    ExamplesFile = h5py.File(ExamplesName, "r")
+    Features = ExamplesFile['Features']
+    Moments = (0,np.zeros(Features.shape[1]),np.zeros(Features.shape[1]))
+    for c in range(Start,Stop,ChunkRows):
+        Moments = MergeMoments(Moments,ChunkMoments(Features[c:min(c+ChunkRows,Stop)]))
+    ExamplesFile.close()
+    return Moments
+
+
+def FeatureMoments(ExamplesName,Start=0,Stop=None,ChunkRows=100000,NumProcesses=1):
+    '''FeatureMoments(ExamplesName,Start,Stop,ChunkRows,NumProcesses)
+    per column (n,Mean,M2) of Features[Start:Stop], in one streaming pass
+
+    Arguments:
+    - ExamplesName -- name of the examples HDF5 file
+    - Start, Stop -- range of examples (e.g. the training set)
+    - ChunkRows -- examples read at once
+    - NumProcesses -- the range is split into one contiguous part per
+      worker process; the parts are merged at the end
+    '''
+    if Stop is None:
+        ExamplesFile = h5py.File(ExamplesName, "r")
+        Stop = ExamplesFile['Features'].shape[0]
+        ExamplesFile.close()
+    Bounds = np.linspace(Start,Stop,NumProcesses+1).astype(np.int64)
+    Args = [(ExamplesName,int(Bounds[i]),int(Bounds[i+1]),ChunkRows)
+        for i in range(NumProcesses)]
+    if NumProcesses > 1:
+        p = Pool(NumProcesses)
+        Parts = p.map(RangeMoments,Args)
+        p.close()
+        p.join()
+    else:
+        Parts = [RangeMoments(a) for a in Args]
+    Moments = Parts[0]
+    for Part in Parts[1:]:
+        Moments = MergeMoments(Moments,Part)
+    return Moments
+
+
+def StoreNormalization(ExamplesName,Start=0,Stop=None,ChunkRows=100000,NumProcesses=1):
+    '''StoreNormalization(ExamplesName,Start,Stop,ChunkRows,NumProcesses)
+    compute normalization parameters over Features[Start:Stop] and
+    store them in the examples file
+
+    Result:
+    - ExamplesFile['FeatureMean'], ExamplesFile['FeatureStd'],
+      with attrs 'Start' and 'Stop' of the range they come from
+    - columns that are constant get a standard deviation of 1
+    '''
+    n,Mean,M2 = FeatureMoments(ExamplesName,Start,Stop,ChunkRows,NumProcesses)
+    Std = np.sqrt(M2/max(n,1))
+    Std[Std == 0] = 1.0
+    ExamplesFile = h5py.File(ExamplesName, "r+")
+    for name,data in [('FeatureMean',Mean),('FeatureStd',Std)]:
+        if name in ExamplesFile:
+            del ExamplesFile[name]
+        dset = ExamplesFile.create_dataset(name, data=data)
+        dset.attrs['Start'] = Start
+        dset.attrs['Stop'] = Start+n
+    ExamplesFile.close()
+
+
+def LoadNormalization(ExamplesFile,Start=None,Stop=None):
+    '''LoadNormalization(ExamplesFile,Start,Stop)
+    (FeatureMean,FeatureStd) stored by StoreNormalization, or None if
+    there are none (or, if Start/Stop are given, they are for another range)'''
+    if 'FeatureMean' not in ExamplesFile or 'FeatureStd' not in ExamplesFile:
+        return None
+    Attrs = ExamplesFile['FeatureMean'].attrs
+    if Start is not None and Attrs['Start'] != Start:
+        return None
+    if Stop is not None and Attrs['Stop'] != Stop:
+        return None
+    return ExamplesFile['FeatureMean'][:], ExamplesFile['FeatureStd'][:]
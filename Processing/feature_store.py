@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+# MIT License
+
+# Copyright (c) 2018 Andrew J. Bean
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import h5py
+import numpy as np
+import aggregate as ag
+import os
+
+# default combined features file, from combine_data.py
+FeaturesName = "2min_aggregated_features.hdf5"
+
+# open read only files, keyed by (process id, absolute file name)
+# a handle is never shared with a forked child process
+_Handles = {}
+# per symbol metadata, keyed by (absolute file name, symbol)
+_SymbolInfo = {}
+
+
+def OpenFeatureFile(Name=FeaturesName):
+    '''OpenFeatureFile(Name)
+    read only h5py.File() for Name, opened once per process
+
+    Arguments:
+    - Name -- name of the combined features HDF5 file
+
+    Return Value:
+    - h5py.File(), shared by all callers in this process; do not close it,
+      see CloseFeatureFiles
+
+    Notes:
+    - can be used as a multiprocessing.Pool initializer, so each worker
+      opens the file once when it starts
+    '''
+    Key = (os.getpid(),os.path.abspath(Name))
+    File = _Handles.get(Key)
+    if File is None or not File.id.valid:
+        File = h5py.File(Name, "r")
+        _Handles[Key] = File
+    return File
+
+
+def ShareFeatureFile(File):
+    '''ShareFeatureFile(File)
+    let OpenFeatureFile return an h5py.File() already opened by the caller'''
+    _Handles[(os.getpid(),os.path.abspath(File.filename))] = File
+
+
+def CloseFeatureFiles():
+    '''close all files opened by OpenFeatureFile in this process'''
+    pid = os.getpid()
+    for Key in [k for k in _Handles if k[0] == pid]:
+        File = _Handles.pop(Key)
+        if File.id.valid:
+            File.close()
+
+
+def SymbolInfo(sym,Name=FeaturesName):
+    '''SymbolInfo(sym,Name)
+    cached metadata of one symbol's data set
+
+    Return Value:
+    - dict with 'shape', 'dtype' and the data set attributes
+      (period, IntervalsPerDay, NumDays)
+    '''
+    Key = (os.path.abspath(Name),sym)
+    if Key not in _SymbolInfo:
+        Data = OpenFeatureFile(Name)[sym]
+        Info = dict(Data.attrs)
+        Info['shape'] = Data.shape
+        Info['dtype'] = Data.dtype
+        _SymbolInfo[Key] = Info
+    return _SymbolInfo[Key]
+
+
+def ReadSymbol(sym,Name=FeaturesName):
+    '''ReadSymbol(sym,Name)
+    all features of one symbol, as a numpy array, through the shared handle'''
+    Info = SymbolInfo(sym,Name)
+    out = np.empty(Info['shape'],dtype=Info['dtype'])
+    if out.size > 0:
+        OpenFeatureFile(Name)[sym].read_direct(out)
+    return out
+
+
+def LoadFeatureParams(AllDataFile,sym='AAPL'):
+    '''LoadFeatureParams(AllDataFile,sym)
+    ag.FeatureParameters() as stored by combine_data.py
+
+    Arguments:
+    - AllDataFile -- h5py.File() of the combined features
+    - sym -- symbol to take IntervalsPerDay from
+    '''
+    grp = AllDataFile['FeatureParams']
+    FeatureParams = ag.FeatureParameters()
+    FeatureParams.StridesLPR = grp['StridesLPR'][:]
+    FeatureParams.StridesSMA = grp['StridesSMA'][:]
+    FeatureParams.VolumeIntervals = grp['VolumeIntervals'][:]
+    FeatureParams.IntervalsPerDay = AllDataFile[sym].attrs['IntervalsPerDay']
+    return FeatureParams
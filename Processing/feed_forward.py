@@ -31,6 +31,8 @@ from keras.optimizers import SGD
 import sys
 from keras.callbacks import ModelCheckpoint
 from keras.utils import plot_model
+import example_stream as es
+import feature_stats as st
 
 def main():
     Gain = '0.5'
@@ -40,6 +42,11 @@ def main():
     DropFrac = '0.0'
     NEpochs = 200
     NameRoot = 'my_model_'
+    # read examples in chunks while training, instead of all at once
+    Streaming = True
+    BatchSize = 1000
+    # scale features by the mean and std of the training set
+    Normalize = True
 
     extension = Gain+','+Loss+'_open'
     print(extension)
@@ -55,12 +62,15 @@ def main():
         SaveName = SaveName + '_Lin'
     if DropFrac!='0.7':
         SaveName = SaveName + '_' + DropFrac
+    if Normalize:
+        SaveName = SaveName + '_Norm'
     # SaveName = SaveName + '_' + str(NEpochs) + '.h5'
     filepath = 'Trained/' + SaveName + "_{epoch:03d}.h5"
     print(filepath)
 
-    # ExamplesFile = h5py.File("2min_aggregated_examples_"+extension+".hdf5", "r")
-    ExamplesFile = h5py.File("2min_examples_"+extension+".hdf5", "r")
+    # ExamplesName = "2min_aggregated_examples_"+extension+".hdf5"
+    ExamplesName = "2min_examples_"+extension+".hdf5"
+    ExamplesFile = h5py.File(ExamplesName, "r")
     print(ExamplesFile['Features'].shape)
     print(ExamplesFile['Outcomes'].shape)
     print(ExamplesFile['Timestamps'].shape)
@@ -68,18 +78,43 @@ def main():
     NumExamples = ExamplesFile['Features'].shape[0]
     FeatureSize = ExamplesFile['Features'].shape[1]
 
-    StartTest = int(0.9*NumExamples)
-    StartVal = int(0.8*NumExamples)
+    StartVal, StartTest = es.SplitRanges(NumExamples)
+
+    Normalization = None
+    if Normalize:
+        Normalization = st.LoadNormalization(ExamplesFile,0,StartVal)
+        if Normalization is None:
+            print('computing normalization parameters...')
+            ExamplesFile.close()
+            st.StoreNormalization(ExamplesName,0,StartVal,NumProcesses=16)
+            ExamplesFile = h5py.File(ExamplesName, "r")
+            Normalization = st.LoadNormalization(ExamplesFile,0,StartVal)
+
+    if Streaming:
+        TrainData = es.ExampleStream(ExamplesFile,0,StartVal,BatchSize=BatchSize,
+            Normalization=Normalization)
+        # by index, so Keras keeps them in file order however far it reads ahead
+        ValData = es.OrderedExamples(ExamplesFile,StartVal,StartTest,BatchSize=BatchSize,
+            Normalization=Normalization)
+        TestData = es.OrderedExamples(ExamplesFile,StartTest,NumExamples,BatchSize=BatchSize,
+            Normalization=Normalization)
+        y_test = ExamplesFile['Outcomes'][StartTest:]
+    else:
+        print('reading data from HDF5...')
+        x_train = ExamplesFile['Features'][:StartVal]
+        y_train = ExamplesFile['Outcomes'][:StartVal]
 
-    print('reading data from HDF5...')
-    x_train = ExamplesFile['Features'][:StartVal]
-    y_train = ExamplesFile['Outcomes'][:StartVal]
+        x_val = ExamplesFile['Features'][StartVal:StartTest]
+        y_val = ExamplesFile['Outcomes'][StartVal:StartTest]
 
-    x_val = ExamplesFile['Features'][StartVal:StartTest]
-    y_val = ExamplesFile['Outcomes'][StartVal:StartTest]
+        x_test = ExamplesFile['Features'][StartTest:]
+        y_test = ExamplesFile['Outcomes'][StartTest:]
 
-    x_test = ExamplesFile['Features'][StartTest:]
-    y_test = ExamplesFile['Outcomes'][StartTest:]
+        if Normalization is not None:
+            Mean,Std = Normalization
+            x_train = (x_train-Mean)/Std
+            x_val = (x_val-Mean)/Std
+            x_test = (x_test-Mean)/Std
 
 
     # DROPOUT - fraction set to zero
@@ -128,19 +163,38 @@ def main():
 
     plot_model(model, to_file='model.png')
 
-    model.fit(x_train, y_train,
-              validation_data = (x_val,y_val),
-              validation_split = 0.15,
-              epochs = NEpochs,
-              batch_size = 1000,
-              callbacks = callbacks_list,
-              verbose = 1)
+    if Streaming:
+        model.fit_generator(TrainData,
+                  steps_per_epoch = len(TrainData),
+                  validation_data = ValData,
+                  validation_steps = len(ValData),
+                  epochs = NEpochs,
+                  callbacks = callbacks_list,
+                  verbose = 1)
+    else:
+        model.fit(x_train, y_train,
+                  validation_data = (x_val,y_val),
+                  validation_split = 0.15,
+                  epochs = NEpochs,
+                  batch_size = BatchSize,
+                  callbacks = callbacks_list,
+                  verbose = 1)
     # model.save(SaveName)
+    if Streaming:
+        print('training data:',TrainData.Loader.Report())
 
-    score = model.evaluate(x_test, y_test, batch_size=128)
+    if Streaming:
+        score = model.evaluate_generator(TestData, steps=len(TestData))
+    else:
+        score = model.evaluate(x_test, y_test, batch_size=128)
     print(score)
 
-    y_predict = model.predict_on_batch(x_test)
+    if Streaming:
+        # TestData is a Sequence in file order, so predictions line up with y_test
+        y_predict = model.predict_generator(TestData, steps=len(TestData))
+        TrainData.close()
+    else:
+        y_predict = model.predict_on_batch(x_test)
     y_predict = np.array([y_predict[i][0] for i in range(len(y_predict))])
     Rearrange = y_predict.argsort()
     y_predict = y_predict[Rearrange]
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+# MIT License
+
+# Copyright (c) 2018 Andrew J. Bean
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+
+
+def FileHash(FName):
+    '''FileHash(FName)
+    sha1 of the contents of file FName, read in blocks so large
+    files are not loaded into memory at once
+
+    Arguments:
+    - FName -- name of the file
+
+    Return Value:
+    - hex digest string
+    '''
+    Hash = hashlib.sha1()
+    with open(FName,'rb') as f:
+        for Block in iter(lambda: f.read(1<<24),b''):
+            Hash.update(Block)
+    return Hash.hexdigest()
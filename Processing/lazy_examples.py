@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+# MIT License
+
+# Copyright (c) 2018 Andrew J. Bean
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import h5py
+import numpy as np
+import make_examples as me
+import feature_store as fs
+from keras.utils import Sequence
+
+
+class ExampleSequence(Sequence):
+    '''ExampleSequence(IndexName,Start,Stop,BatchSize,Shuffle,Label,FeaturesName)
+    batches of examples from an index file written by
+    make_examples.GenerateExampleIndex, with the feature vectors
+    assembled from the features file when read
+
+    Arguments:
+    - IndexName -- name of the index HDF5 file
+    - Start, Stop -- range of examples to use (e.g. the training set)
+    - BatchSize -- examples per batch
+    - Shuffle -- if True, batches are drawn in random order, reshuffled each epoch
+    - Label -- None for Outcomes, or k for column k of OutcomeGrid
+    - FeaturesName -- features file, defaults to the one the index was made from
+
+    Notes:
+    - batch i is (Features,Outcomes), the same values make_examples
+      would have stored for those examples
+    - for each symbol in a batch, only the union of the rows needed by
+      its examples is read from the features file
+    '''
+    def __init__(self,IndexName,Start=0,Stop=None,BatchSize=32,Shuffle=False,Label=None,
+            FeaturesName=None):
+        IndexFile = h5py.File(IndexName, "r")
+        self.SymbolIdx = IndexFile['SymbolIdx'][Start:Stop]
+        self.TimeIdx = IndexFile['TimeIdx'][Start:Stop]
+        if Label is None:
+            self.Outcomes = IndexFile['Outcomes'][Start:Stop]
+        else:
+            self.Outcomes = IndexFile['OutcomeGrid'][Start:Stop,Label]
+        self.Timestamps = IndexFile['Timestamps'][Start:Stop]
+        self.AllSymbols = [n.decode('UTF-8') for n in IndexFile['AllSymbols']]
+        if FeaturesName is None:
+            FeaturesName = IndexFile.attrs['FeaturesFile']
+        NumSkips = IndexFile.attrs['NumSkips']
+        IndexFile.close()
+        if NumSkips != me.NumSkips:
+            raise ValueError('index was made with NumSkips = '+str(NumSkips))
+
+        self.FeaturesFile = fs.OpenFeatureFile(FeaturesName)
+        self.FeatureParams = fs.LoadFeatureParams(self.FeaturesFile,
+            self.AllSymbols[self.SymbolIdx[0]] if len(self.SymbolIdx) else self.AllSymbols[0])
+        self.RowOffsets,self.Columns = me.ExampleOffsets(self.FeatureParams)
+        # distinct rows needed around each example's time
+        self.Rows = np.unique(self.RowOffsets)
+        self.BatchSize = BatchSize
+        self.Shuffle = Shuffle
+        self.Order = np.arange(len(self.TimeIdx))
+        self.on_epoch_end()
+
+    def __len__(self):
+        return (len(self.TimeIdx)+self.BatchSize-1)//self.BatchSize
+
+    def __getitem__(self,i):
+        Sel = self.Order[i*self.BatchSize:(i+1)*self.BatchSize]
+        return self.Features(Sel), self.Outcomes[Sel]
+
+    def on_epoch_end(self):
+        if self.Shuffle:
+            np.random.shuffle(self.Order)
+
+    def Features(self,Sel):
+        '''Features(Sel)
+        feature vectors of the examples with indices Sel (relative to Start)
+
+        Return Value:
+        - numpy array, size (len(Sel),NumFeatures)
+        '''
+        Sel = np.asarray(Sel)
+        out = np.empty((len(Sel),1+len(self.RowOffsets)))
+        IntervalsPerDay = self.FeatureParams.IntervalsPerDay
+        Times = self.TimeIdx[Sel]
+        # time of day, from opening bell, in [0,1)
+        out[:,0] = (Times%IntervalsPerDay)/IntervalsPerDay
+        Symbols = self.SymbolIdx[Sel]
+        for s in np.unique(Symbols):
+            Mine = np.flatnonzero(Symbols==s)
+            T = Times[Mine]
+            # every row any of these examples needs, sorted
+            Needed = np.unique((T[:,np.newaxis]+self.Rows).ravel())
+            Data = self.FeaturesFile[self.AllSymbols[s]]
+            if Needed[-1]-Needed[0]+1 <= 4*len(Needed):
+                # close together, one contiguous read is cheaper
+                Block = Data[Needed[0]:Needed[-1]+1]
+                Pos = T[:,np.newaxis]+self.RowOffsets-Needed[0]
+            else:
+                Block = Data[Needed]
+                Pos = np.searchsorted(Needed,T[:,np.newaxis]+self.RowOffsets)
+            out[Mine,1:] = Block[Pos,self.Columns]
+        return out
+
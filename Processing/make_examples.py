@@ -25,8 +25,11 @@
 import h5py
 import numpy as np
 import aggregate as ag
+import feature_store as fs
 import sys
+import os
 import time
+import zlib
 from numba import jit
 from multiprocessing import Pool
 
@@ -34,41 +37,81 @@ from multiprocessing import Pool
 NumSkips = 20
 
 def main():
-    AllDataFile = h5py.File("2min_aggregated_features.hdf5", "r")
+    AllDataFile = fs.OpenFeatureFile(fs.FeaturesName)
     if 'FeatureParams' not in AllDataFile:
         sys.exit(0)
     grp = AllDataFile['FeatureParams']
     if 'StridesLPR' not in grp:
         sys.exit(0)
 
-    FeatureParams = ag.FeatureParameters()
-    FeatureParams.StridesLPR = grp['StridesLPR'][:]
-    FeatureParams.StridesSMA = grp['StridesSMA'][:]
-    FeatureParams.VolumeIntervals = grp['VolumeIntervals'][:]
-    FeatureParams.IntervalsPerDay = AllDataFile['AAPL'].attrs['IntervalsPerDay']
+    FeatureParams = fs.LoadFeatureParams(AllDataFile)
 
     T0 = time.time()
 
     Gain = '0.5'
     Loss = '0.5'
-    Features, Outcomes, Timestamps = GenerateExamples(
-        AllDataFile,
-        FeatureParams,
-        Loss=1-float(Loss)/100.0,
-        Gain=1+float(Gain)/100.0,
-        Horizon=FeatureParams.IntervalsPerDay)
-    print('going to make HDF5 file...')
-    ExamplesFile = h5py.File("2min_aggregated_examples_"+Gain+","+Loss+"_open.hdf5", "w")
-    ExamplesFile.create_dataset('Features', data=Features)
-    ExamplesFile.create_dataset('Outcomes', data=Outcomes)
-    ExamplesFile.create_dataset('Timestamps', data=Timestamps)
+    # write examples through a scratch file and merge them on disk,
+    # instead of holding all of them in RAM
+    OnDisk = True
+    # only store (symbol, time index) for each example, the feature
+    # vectors are assembled when read (see lazy_examples.py)
+    Lazy = False
+    NumProcesses = 16
+    # extra (Loss,Gain,Horizon) settings labeled in the same run,
+    # stored as OutcomeGrid/LabelGrid next to the shared Features
+    LabelGrid = None
+    # LabelGrid = [(1-l/100.0,1+g/100.0,FeatureParams.IntervalsPerDay)
+    #     for g in [0.25,0.5,1.0] for l in [0.25,0.5,1.0]]
+    ExamplesName = "2min_aggregated_examples_"+Gain+","+Loss+"_open.hdf5"
+    if Lazy:
+        IndexFile = h5py.File("2min_aggregated_index_"+Gain+","+Loss+"_open.hdf5", "w")
+        GenerateExampleIndex(
+            AllDataFile,
+            FeatureParams,
+            IndexFile,
+            Loss=1-float(Loss)/100.0,
+            Gain=1+float(Gain)/100.0,
+            Horizon=FeatureParams.IntervalsPerDay,
+            NumProcesses=NumProcesses,
+            LabelGrid=LabelGrid)
+        IndexFile.close()
+    elif OnDisk:
+        ExamplesFile = h5py.File(ExamplesName, "w")
+        GenerateExamplesToFile(
+            AllDataFile,
+            FeatureParams,
+            ExamplesFile,
+            Loss=1-float(Loss)/100.0,
+            Gain=1+float(Gain)/100.0,
+            Horizon=FeatureParams.IntervalsPerDay,
+            NumProcesses=NumProcesses,
+            LabelGrid=LabelGrid)
+        ExamplesFile.close()
+    else:
+        Result = GenerateExamples(
+            AllDataFile,
+            FeatureParams,
+            Loss=1-float(Loss)/100.0,
+            Gain=1+float(Gain)/100.0,
+            Horizon=FeatureParams.IntervalsPerDay,
+            NumProcesses=NumProcesses,
+            LabelGrid=LabelGrid)
+        print('going to make HDF5 file...')
+        ExamplesFile = h5py.File(ExamplesName, "w")
+        ExamplesFile.create_dataset('Features', data=Result[0])
+        ExamplesFile.create_dataset('Outcomes', data=Result[1])
+        ExamplesFile.create_dataset('Timestamps', data=Result[2])
+        if LabelGrid is not None:
+            ExamplesFile.create_dataset('OutcomeGrid', data=Result[3])
+            ExamplesFile.create_dataset('LabelGrid', data=LabelGridArray(LabelGrid))
 
     T1 = time.time()
     print('Seconds = ',(T1-T0))
 
 
-def GenerateExamples(AllData,FeatureParams,Loss=0.99,Gain=1.02,Horizon=195):
-    '''GenerateExamples(AllData,FeatureParams,Loss,Gain,Horizon)
+def GenerateExamples(AllData,FeatureParams,Loss=0.99,Gain=1.02,Horizon=195,
+        Seed=0,NumProcesses=1,LabelGrid=None):
+    '''GenerateExamples(AllData,FeatureParams,Loss,Gain,Horizon,Seed,NumProcesses,LabelGrid)
 
     Arguments:
     - AllData -- h5py.File()
@@ -76,54 +119,41 @@ def GenerateExamples(AllData,FeatureParams,Loss=0.99,Gain=1.02,Horizon=195):
     - Loss -- acceptable loss factor (stop loss level for sell)
     - Gain -- gain factor (limit order for sell)
     - Horizon -- duration after buy for sell order to happen
+    - Seed -- examples are sampled with SymbolSeed(sym,Seed) for each symbol
+    - NumProcesses -- number of worker processes, each doing whole symbols
+    - LabelGrid -- optional list of extra (Loss,Gain,Horizon) settings
 
     Return Value:
     - Features -- numpy array with all feature vectors
     - Outcomes -- numpy array with all corresponding investment outcomes
     - Timestamps -- numpy array with all timestamps (start of investment position)
+    - OutcomeGrid -- only if LabelGrid is given, numpy array with
+      OutcomeGrid[i,k] the outcome for setting LabelGrid[k]
     - Features[i,:],Outcomes[i],Timestamps[i] go together as one example
     - all examples are sorted according to Timestamps, increasing order
+    - the result does not depend on NumProcesses
     '''
     # AllData - h5py.File()
     AllSymbols = [n.decode('UTF-8') for n in AllData['AllSymbols']]
 
     # generate all desired examples, then sort by time
-    # MAY NEED TO REARCHITECT THIS, IF IT DOES NOT
-    #   FIT IN RAM (QUITE LIKELY), as follows:
-    #
-    # Timestamps should all fit in ram, and can be sorted
-    # save all single symbol Features,Outcomes,Timestamps arrays to
-    #   HDF5 file - f[sym/data][j,:], f[sym/outcome], f[sym/times]
-    # clear all data from RAM
-    # create list of tuples -- (timestamp,sym,idx)
-    # Determine rearrange indices from timestamp arrays
-    # sort tuples by rearrange indices
-    # create new HDF5 file with space allocated for all examples
-    # go through tuples in sorted order, copying examples into HDF5
+    # all examples have to fit in RAM (twice, for the sort)
+    # see GenerateExamplesToFile for when they don't
     # AllSymbols = AllSymbols[:5]
 
-    if True:
-        Features   = []
-        Outcomes   = []
-        Timestamps = []
-        for sym in AllSymbols:
-            print('symbol is',sym)
-            F,O,T = GenerateExamplesForSymbol(
-                sym,FeatureParams,Loss,Gain,Horizon)
-            if F.shape[0] > 0:
-                Features.append(F)
-                Outcomes.append(O)
-                Timestamps.append(T)
-            print('added',len(F),' for symbol',sym)
-    else:
-        p = Pool(16)
-        results = p.starmap(
-            GenerateExamplesForSymbol,
-            [(sym,FeatureParams,Loss,Gain,Horizon) for sym in AllSymbols]
-            )
-        Features = [results[i][0] for i in range(len(results))]
-        Outcomes = [results[i][0] for i in range(len(results))]
-        Timestamps = [results[i][0] for i in range(len(results))]
+    Features   = []
+    Outcomes   = []
+    Timestamps = []
+    OutcomeGrid = []
+    fs.ShareFeatureFile(AllData)
+    for sym,F,O,T,*G in ExamplesForSymbols(AllSymbols,FeatureParams,
+            Loss,Gain,Horizon,Seed,NumProcesses,LabelGrid,FeaturesName=AllData.filename):
+        if F.shape[0] > 0:
+            Features.append(F)
+            Outcomes.append(O)
+            Timestamps.append(T)
+            OutcomeGrid += G
+        print('added',len(F),' for symbol',sym)
 
     print('going to concatenate...')
     print('...Features')
@@ -134,60 +164,385 @@ def GenerateExamples(AllData,FeatureParams,Loss=0.99,Gain=1.02,Horizon=195):
     Timestamps = np.concatenate(Timestamps)
     # timsort takes advantage of large contiguous sorted sections
     print('determining sort order...')
-    Rearrange = Timestamps.argsort()
+    Rearrange = Timestamps.argsort(kind='stable')
     print('rearranging data to be sorted...')
+    if LabelGrid is not None:
+        OutcomeGrid = np.concatenate(OutcomeGrid)
+        return (Features[Rearrange,:], Outcomes[Rearrange], Timestamps[Rearrange],
+            OutcomeGrid[Rearrange,:])
     return Features[Rearrange,:], Outcomes[Rearrange], Timestamps[Rearrange]
 
 
-def GenerateExamplesForSymbol(Data,FeatureParams,Loss=0.99,Gain=1.02,Horizon=195):
-    '''GenerateExamplesForSymbol(Data,FeatureParams,Loss,Gain,Horizon)
+def GenerateExamplesToFile(AllData,FeatureParams,ExamplesFile,Loss=0.99,Gain=1.02,Horizon=195,
+        Seed=0,NumProcesses=1,ScratchName='examples_scratch.hdf5',MemoryBudget=2**30,
+        LabelGrid=None):
+    '''GenerateExamplesToFile(AllData,FeatureParams,ExamplesFile,Loss,Gain,Horizon,
+        Seed,NumProcesses,ScratchName,MemoryBudget,LabelGrid)
+    same as GenerateExamples, but the examples never all have to fit in RAM
 
     Arguments:
-    - Data -- h5py dataset for a symbol
+    - AllData -- h5py.File()
+    - FeatureParams -- ag.FeatureParameters(), initiated from the HDF5 file
+    - ExamplesFile -- h5py.File(), open for writing
+    - Loss -- acceptable loss factor (stop loss level for sell)
+    - Gain -- gain factor (limit order for sell)
+    - Horizon -- duration after buy for sell order to happen
+    - Seed -- as for GenerateExamples
+    - NumProcesses -- as for GenerateExamples
+    - ScratchName -- temporary HDF5 file, removed when done
+    - MemoryBudget -- bytes of examples to hold in RAM at once
+    - LabelGrid -- as for GenerateExamples
+
+    Result:
+    - ExamplesFile['Features'], ExamplesFile['Outcomes'], ExamplesFile['Timestamps']
+      same as the return values of GenerateExamples
+    - with LabelGrid, also ExamplesFile['OutcomeGrid'] and
+      ExamplesFile['LabelGrid'] (rows of Loss,Gain,Horizon)
+
+    Notes:
+    - each symbol's examples are written to the scratch file as they
+      are made, already in time order
+    - only the timestamps are read back and sorted, then the symbols
+      are merged in blocks of rows directly into ExamplesFile
+    '''
+    AllSymbols = [n.decode('UTF-8') for n in AllData['AllSymbols']]
+
+    Scratch = h5py.File(ScratchName, "w")
+    Symbols = []
+    fs.ShareFeatureFile(AllData)
+    for sym,F,O,T,*G in ExamplesForSymbols(AllSymbols,FeatureParams,
+            Loss,Gain,Horizon,Seed,NumProcesses,LabelGrid,FeaturesName=AllData.filename):
+        if F.shape[0] > 0:
+            Scratch.create_dataset(sym+'/Features', data=F)
+            Scratch.create_dataset(sym+'/Outcomes', data=O)
+            Scratch.create_dataset(sym+'/Timestamps', data=T)
+            if LabelGrid is not None:
+                Scratch.create_dataset(sym+'/OutcomeGrid', data=G[0])
+            Symbols.append(sym)
+        print('added',len(F),' for symbol',sym)
+        del F,O,T,G
+
+    MergeExamples(Scratch,Symbols,ExamplesFile,MemoryBudget)
+    if LabelGrid is not None:
+        ExamplesFile.create_dataset('LabelGrid', data=LabelGridArray(LabelGrid))
+    Scratch.close()
+    os.remove(ScratchName)
+
+
+def GenerateExampleIndex(AllData,FeatureParams,IndexFile,Loss=0.99,Gain=1.02,Horizon=195,
+        Seed=0,NumProcesses=1,LabelGrid=None):
+    '''GenerateExampleIndex(AllData,FeatureParams,IndexFile,Loss,Gain,Horizon,
+        Seed,NumProcesses,LabelGrid)
+    same examples as GenerateExamples, but without the feature vectors
+
+    Arguments:
+    - AllData -- h5py.File()
+    - FeatureParams -- ag.FeatureParameters(), initiated from the HDF5 file
+    - IndexFile -- h5py.File(), open for writing
+    - Loss, Gain, Horizon, Seed, NumProcesses, LabelGrid -- as for GenerateExamples
+
+    Result:
+    - IndexFile['SymbolIdx'] -- index into IndexFile['AllSymbols'] for each example
+    - IndexFile['TimeIdx'] -- row of the symbol's features for each example
+    - IndexFile['Outcomes'], IndexFile['Timestamps'] (and with LabelGrid,
+      IndexFile['OutcomeGrid'] and IndexFile['LabelGrid']),
+      same as for GenerateExamples, in the same order
+    - IndexFile.attrs['NumSkips'] and IndexFile.attrs['FeaturesFile']
+    - lazy_examples.ExampleSequence reads the feature vectors back
+    '''
+    AllSymbols = [n.decode('UTF-8') for n in AllData['AllSymbols']]
+
+    SymbolIdx  = []
+    TimeIdx    = []
+    Outcomes   = []
+    Timestamps = []
+    OutcomeGrid = []
+    fs.ShareFeatureFile(AllData)
+    for sym,I,O,T,*G in ExamplesForSymbols(AllSymbols,FeatureParams,
+            Loss,Gain,Horizon,Seed,NumProcesses,LabelGrid,IndexOnly=True,
+            FeaturesName=AllData.filename):
+        if I.shape[0] > 0:
+            SymbolIdx.append(np.full(len(I),AllSymbols.index(sym),dtype=np.int32))
+            TimeIdx.append(I)
+            Outcomes.append(O)
+            Timestamps.append(T)
+            OutcomeGrid += G
+        print('added',len(I),' for symbol',sym)
+
+    # all in RAM, the index is small
+    Timestamps = np.concatenate(Timestamps)
+    Rearrange = Timestamps.argsort(kind='stable')
+    IndexFile.create_dataset('SymbolIdx', data=np.concatenate(SymbolIdx)[Rearrange])
+    IndexFile.create_dataset('TimeIdx', data=np.concatenate(TimeIdx)[Rearrange])
+    IndexFile.create_dataset('Outcomes', data=np.concatenate(Outcomes)[Rearrange])
+    IndexFile.create_dataset('Timestamps', data=Timestamps[Rearrange])
+    if LabelGrid is not None:
+        IndexFile.create_dataset('OutcomeGrid', data=np.concatenate(OutcomeGrid)[Rearrange,:])
+        IndexFile.create_dataset('LabelGrid', data=LabelGridArray(LabelGrid))
+    IndexFile.create_dataset('AllSymbols', data=AllData['AllSymbols'][:])
+    IndexFile.attrs['NumSkips'] = NumSkips
+    IndexFile.attrs['FeaturesFile'] = AllData.filename
+
+
+def MergeExamples(Scratch,Symbols,ExamplesFile,MemoryBudget=2**30):
+    '''MergeExamples(Scratch,Symbols,ExamplesFile,MemoryBudget)
+    merge per-symbol examples into one data set sorted by time
+
+    Arguments:
+    - Scratch -- h5py.File() with Scratch[sym]['Features'], ['Outcomes'] and
+      ['Timestamps'] for each symbol, each sorted by timestamp
+      (and ['OutcomeGrid'], if the examples have one)
+    - Symbols -- list of the symbols in Scratch to merge
+    - ExamplesFile -- h5py.File(), open for writing
+    - MemoryBudget -- bytes of examples to hold in RAM at once
+    '''
+    print('determining sort order...')
+    Counts = np.array([Scratch[sym]['Timestamps'].shape[0] for sym in Symbols],dtype=np.int64)
+    Total = int(np.sum(Counts))
+    if len(Symbols) == 0:
+        ExamplesFile.create_dataset('Features', data=np.zeros((0,0)))
+        ExamplesFile.create_dataset('Outcomes', data=np.zeros(0))
+        ExamplesFile.create_dataset('Timestamps', data=np.zeros(0))
+        return
+    # which symbol each example comes from, in sorted order
+    # stable sort of the concatenated sorted runs is the k-way merge
+    Timestamps = np.concatenate([Scratch[sym]['Timestamps'][:] for sym in Symbols])
+    Source = np.repeat(np.arange(len(Symbols)),Counts)
+    Source = Source[Timestamps.argsort(kind='stable')]
+    del Timestamps
+
+    First = Scratch[Symbols[0]]
+    Out = {}
+    for name in ['Features','Outcomes','Timestamps','OutcomeGrid']:
+        if name not in First:
+            continue
+        Out[name] = ExamplesFile.create_dataset(name,
+            (Total,)+First[name].shape[1:],dtype=First[name].dtype)
+    RowBytes = sum(First[name].dtype.itemsize*int(np.prod(First[name].shape[1:]))
+        for name in Out)
+    BlockRows = max(1,MemoryBudget//RowBytes)
+
+    print('merging',Total,'examples...')
+    # next unread example of each symbol
+    Next = np.zeros(len(Symbols),dtype=np.int64)
+    for Start in range(0,Total,BlockRows):
+        Stop = min(Start+BlockRows,Total)
+        Block = Source[Start:Stop]
+        # rows of the block from each symbol are a contiguous
+        # range of that symbol's examples
+        Order = Block.argsort(kind='stable')
+        Taken = np.bincount(Block,minlength=len(Symbols))
+        for name in Out:
+            Buffer = np.empty((Stop-Start,)+Out[name].shape[1:],dtype=Out[name].dtype)
+            Pos = 0
+            for s in np.flatnonzero(Taken):
+                n = Taken[s]
+                Buffer[Order[Pos:Pos+n]] = Scratch[Symbols[s]][name][Next[s]:Next[s]+n]
+                Pos += n
+            Out[name][Start:Stop] = Buffer
+        Next += Taken
+
+
+def SymbolSeed(sym,Seed=0):
+    '''seed for sampling the examples of one symbol
+    the same wherever and in whatever order the symbol is done'''
+    return [Seed,zlib.crc32(sym.encode('UTF-8'))]
+
+
+def ExamplesForSymbols(AllSymbols,FeatureParams,Loss,Gain,Horizon,Seed=0,NumProcesses=1,
+        LabelGrid=None,IndexOnly=False,FeaturesName=fs.FeaturesName):
+    '''ExamplesForSymbols(AllSymbols,FeatureParams,Loss,Gain,Horizon,Seed,NumProcesses,
+        LabelGrid,IndexOnly,FeaturesName)
+    generator of (sym,Features,Outcomes,Timestamps), in the order of AllSymbols
+    (with OutcomeGrid at the end if LabelGrid is given,
+    and time indices in place of Features if IndexOnly)
+    from GenerateExamplesForSymbol, run in NumProcesses worker processes
+
+    - each worker opens the features file FeaturesName once, read only,
+      when it starts (see feature_store.py)
+    - results are streamed back in order as they are done; at most
+      2*NumProcesses symbols are in progress or waiting to be consumed,
+      so a slow consumer does not let finished results pile up
+    '''
+    Args = [(sym,FeatureParams,Loss,Gain,Horizon,SymbolSeed(sym,Seed),LabelGrid,IndexOnly,
+        FeaturesName) for sym in AllSymbols]
+    if NumProcesses > 1:
+        p = Pool(NumProcesses,initializer=fs.OpenFeatureFile,initargs=(FeaturesName,))
+        try:
+            MaxOutstanding = 2*NumProcesses
+            Outstanding = []
+            Next = 0
+            while Next < len(Args) or Outstanding:
+                # keep a bounded window of symbols submitted
+                while Next < len(Args) and len(Outstanding) < MaxOutstanding:
+                    Outstanding.append((Args[Next],
+                        p.apply_async(GenerateExamplesForSymbol,Args[Next])))
+                    Next += 1
+                Arg,Result = Outstanding.pop(0)
+                Result = Result.get()
+                # refill before handing the result over, so workers stay busy
+                if Next < len(Args):
+                    Outstanding.append((Args[Next],
+                        p.apply_async(GenerateExamplesForSymbol,Args[Next])))
+                    Next += 1
+                print('symbol is',Arg[0])
+                yield (Arg[0],)+Result
+                del Result
+            p.close()
+        finally:
+            # also if the consumer stops early or fails, so no workers
+            # or pending results are left behind
+            p.terminate()
+            p.join()
+    else:
+        for Arg in Args:
+            print('symbol is',Arg[0])
+            yield (Arg[0],)+GenerateExamplesForSymbol(*Arg)
+
+
+def GenerateExamplesForSymbol(Data,FeatureParams,Loss=0.99,Gain=1.02,Horizon=195,Seed=None,
+        LabelGrid=None,IndexOnly=False,FeaturesName=fs.FeaturesName):
+    '''GenerateExamplesForSymbol(Data,FeatureParams,Loss,Gain,Horizon,Seed,LabelGrid,IndexOnly,
+        FeaturesName)
+
+    Arguments:
+    - Data -- name of the symbol's data set in the features file
     - FeatureParams -- ag.FeatureParameters(), initiated from the HDF5 file
     - Loss -- acceptable loss factor (stop loss level for sell)
     - Gain -- gain factor (limit order for sell)
     - Horizon -- duration after buy for sell order to happen
+    - Seed -- seed for sampling the example times, e.g. SymbolSeed(sym),
+      or None to use the global numpy random state
+    - LabelGrid -- optional list of extra (Loss,Gain,Horizon) settings,
+      labeled in the same pass as (Loss,Gain,Horizon)
+    - IndexOnly -- if True, return the time indices of the examples
+      in place of Features, without making the feature vectors
+    - FeaturesName -- the features file, read through the per-process
+      handle of feature_store.OpenFeatureFile
 
     Return Value:
     - Features -- numpy array with all feature vectors
     - Outcomes -- numpy array with all corresponding investment outcomes
     - Timestamps -- numpy array with all timestamps (start of investment position)
+    - OutcomeGrid -- only if LabelGrid is given, numpy array with
+      OutcomeGrid[i,k] the outcome for setting LabelGrid[k]
     - Features[i,:],Outcomes[i],Timestamps[i] go together as one example
     - all examples are sorted according to Timestamps, increasing order
+    - example times leave room for the longest horizon of all settings
     '''
-    AllDataFile = h5py.File("2min_aggregated_features.hdf5", "r")
-    Data = AllDataFile[Data][:]
-    # print(type(Data))
+    Random = np.random if Seed is None else np.random.RandomState(Seed)
+    Data = fs.ReadSymbol(Data,FeaturesName)
     IntervalsPerDay = FeatureParams.IntervalsPerDay
+    # primary setting first, then the grid
+    Settings = LabelGridArray([(Loss,Gain,Horizon)]+list(
+        LabelGrid if LabelGrid is not None else []))
+    Horizons = Settings[:,2].astype(np.int64)
     MinTimeIdx = FeatureParams.StridesLPR[-1]*NumSkips
-    MaxTimeIdx = Data.shape[0] - Horizon
+    MaxTimeIdx = Data.shape[0] - np.max(Horizons)
     if MinTimeIdx>MaxTimeIdx:
-        return np.array([]),np.array([]),np.array([])
+        First = np.zeros(0,dtype=np.int64) if IndexOnly else np.array([])
+        if LabelGrid is not None:
+            return First,np.array([]),np.array([]),np.zeros((0,len(Settings)-1))
+        return First,np.array([]),np.array([])
     IdxList = []
     TestTime = MinTimeIdx
     # basically a do while loop
     while True:
         IdxList.append(TestTime)
-        TestTime += np.random.randint(1,2*IntervalsPerDay,1)[0]
+        TestTime += Random.randint(1,2*IntervalsPerDay,1)[0]
         # TestTime += IntervalsPerDay
         if TestTime > MaxTimeIdx:
             break
 
-    FirstF,FirstO = MakeExample(Data,FeatureParams,IdxList[0],Loss,Gain,Horizon)
-    Features = np.zeros((len(IdxList),len(FirstF)))
-    Features[0,:] = FirstF
-    Outcomes = np.zeros(len(IdxList))
-    Outcomes[0] = FirstO
-    Timestamps = np.zeros(len(IdxList))
-    Timestamps[0] = Data[IdxList[0],0]
-    for i in range(1,len(IdxList)):
-        Features[i,:],Outcomes[i] = MakeExample(Data,FeatureParams,IdxList[i],Loss,Gain,Horizon)
-        Timestamps[i] = Data[IdxList[i],0]
+    IdxList = np.array(IdxList,dtype=np.int64)
+    if IndexOnly:
+        Features = IdxList
+    else:
+        Features = MakeExamples(Data,FeatureParams,IdxList)
+    AllOutcomes = SuccessGrid(Data,IdxList,Settings[:,0],Settings[:,1],Horizons)
+    Outcomes = AllOutcomes[:,0]
+    Timestamps = Data[IdxList,0].astype(np.float64)
 
+    if LabelGrid is not None:
+        return Features, Outcomes, Timestamps, AllOutcomes[:,1:]
     return Features, Outcomes, Timestamps
 
 
+def LabelGridArray(LabelGrid):
+    '''(Loss,Gain,Horizon) settings as a numpy array, one row per setting'''
+    return np.array(LabelGrid,dtype=np.float64).reshape(-1,3)
+
+
+def ExampleOffsets(FeatureParams):
+    '''ExampleOffsets(FeatureParams)
+    where MakeExample takes each feature from, relative to Time
+
+    Arguments:
+    - FeatureParams -- ag.FeatureParameters(), initiated from the HDF5 file
+
+    Return Values:
+    - RowOffsets -- numpy array of ints
+    - Columns -- numpy array of ints
+    - feature j+1 of MakeExample(Data,FeatureParams,Time) is
+      Data[Time+RowOffsets[j],Columns[j]]
+      (feature 0 is the time of day)
+    '''
+    N = NumSkips
+
+    NumStridesLPR = len(FeatureParams.StridesLPR)
+    NumStridesSMA = len(FeatureParams.StridesSMA)
+    NumVolumeIntervals = len(FeatureParams.VolumeIntervals)
+
+    LPRsStart = 6
+    SMAsStart = LPRsStart + 4*NumStridesLPR
+    VolStart  = SMAsStart + NumStridesSMA
+
+    # same order as MakeExample:
+    # Data[Time - Stride*N:Time:Stride,Column] for each (Stride,Column)
+    Samples = ([]
+        +[(FeatureParams.StridesLPR[i],LPRsStart+IDX)
+        for i in range(NumStridesLPR)
+        for IDX in range(i,4*NumStridesLPR,NumStridesLPR) ]
+        +[(FeatureParams.StridesLPR[i],SMAsStart+IDX)
+        for i in range(NumStridesLPR)
+        for IDX in range(NumStridesSMA)]
+        +[(FeatureParams.StridesLPR[i],VolStart+IDX)
+        for i in range(NumStridesLPR)
+        for IDX in range(NumVolumeIntervals)]
+        )
+    RowOffsets = np.concatenate([np.arange(-Stride*N,0,Stride) for Stride,Column in Samples])
+    Columns = np.concatenate([np.full(N,Column) for Stride,Column in Samples])
+    return RowOffsets, Columns
+
+
+def MakeExamples(Data,FeatureParams,IdxList,out=None,BatchSize=256):
+    '''MakeExamples(Data,FeatureParams,IdxList,out,BatchSize)
+    feature vectors of MakeExample for many times at once
+
+    Arguments:
+    - Data -- numpy array of the features for a symbol
+    - FeatureParams -- ag.FeatureParameters(), initiated from the HDF5 file
+    - IdxList -- time indices around which to compute the examples
+    - out -- optional numpy array, size (len(IdxList),NumFeatures), to write into
+    - BatchSize -- number of examples gathered per fancy-indexing step
+
+    Return Value:
+    - numpy array, size (len(IdxList),NumFeatures)
+      out[i,:] is the feature vector of MakeExample(Data,FeatureParams,IdxList[i])
+    '''
+    Times = np.asarray(IdxList)
+    IntervalsPerDay = FeatureParams.IntervalsPerDay
+    RowOffsets,Columns = ExampleOffsets(FeatureParams)
+    if out is None:
+        out = np.empty((len(Times),1+len(RowOffsets)))
+    # time of day, from opening bell, in [0,1)
+    out[:,0] = (Times%IntervalsPerDay)/IntervalsPerDay
+    for Start in range(0,len(Times),BatchSize):
+        Stop = min(Start+BatchSize,len(Times))
+        out[Start:Stop,1:] = Data[Times[Start:Stop,np.newaxis]+RowOffsets,Columns]
+    return out
+
+
 def MakeExample(Data,FeatureParams,Time=0,Loss=0.99,Gain=1.02,Horizon=195):
     '''MakeExample(Data,FeatureParams,Time,Loss,Gain,Horizon)
     Arguments:
@@ -293,9 +648,85 @@ def Success(Data,Time,Loss,Gain,Horizon):
         return max(min(Relative,1.0),0.0)
 
 
-if __name__ == '__main__':
-    main()
 
+@jit
+def SuccessGrid(Data,Times,Losses,Gains,Horizons):
+    '''SuccessGrid(Data,Times,Losses,Gains,Horizons)
+    Success for many entry times and (Loss,Gain,Horizon) settings at once
 
+    Arguments:
+    - Data -- numpy array of the features for a symbol
+    - Times -- numpy array of time indices to buy at
+    - Losses -- numpy array, acceptable loss factor for each setting
+    - Gains -- numpy array, gain factor for each setting
+    - Horizons -- numpy array, duration after buy for each setting
+
+    Return Value:
+    - numpy array, size (len(Times),len(Losses))
+      out[i,k] is Success(Data,Times[i],Losses[k],Gains[k],Horizons[k])
+
+    Notes:
+    - for each entry time, a single scan forward (up to the longest
+      horizon) sweeps through the gain levels in increasing order
+      and the loss levels in decreasing order, recording when each
+      level is first reached; every setting is then read off from
+      those first hits
+    '''
+    # same buy price as Success
+    BuyIdx = 4
+    NumSettings = len(Losses)
+    GainOrder = np.argsort(Gains)
+    LossOrder = np.argsort(-Losses)
+    MaxHorizon = 0
+    for k in range(NumSettings):
+        MaxHorizon = max(MaxHorizon,Horizons[k])
+    GainHit = np.zeros(NumSettings,dtype=np.int64)
+    LossHit = np.zeros(NumSettings,dtype=np.int64)
+    out = np.zeros((len(Times),NumSettings))
+
+    for i in range(len(Times)):
+        Time = Times[i]
+        Buy = Data[Time,BuyIdx]
+        # first offset from Time at which each level is reached,
+        # MaxHorizon if never
+        GainHit[:] = MaxHorizon
+        LossHit[:] = MaxHorizon
+        NextGain = 0
+        NextLoss = 0
+        Offset = 0
+        while (Offset < MaxHorizon and Time+Offset < Data.shape[0]
+                and (NextGain < NumSettings or NextLoss < NumSettings)):
+            # limit order sells (success)
+            while NextGain < NumSettings and not Data[Time+Offset,2]/Buy < Gains[GainOrder[NextGain]]:
+                GainHit[GainOrder[NextGain]] = Offset
+                NextGain += 1
+            # stop loss sells (fail)
+            while NextLoss < NumSettings and not Data[Time+Offset,3]/Buy > Losses[LossOrder[NextLoss]]:
+                LossHit[LossOrder[NextLoss]] = Offset
+                NextLoss += 1
+            Offset += 1
+
+        for k in range(NumSettings):
+            Loss = Losses[k]
+            Gain = Gains[k]
+            Horizon = Horizons[k]
+            Idx = Time + min(GainHit[k],Horizon)
+            Idx2 = Time + min(LossHit[k],Horizon)
+            if Idx2>Idx:
+                out[i,k] = 1.0
+            elif Idx2<Idx:
+                out[i,k] = 0.0
+            else:
+                if Idx-Time < Horizon:
+                    ClosePrice = Data[Idx,1]
+                else:
+                    ClosePrice = Data[Idx-1,1]
+                Relative = ClosePrice / Data[Time,BuyIdx]
+                Relative -= Loss
+                Relative /= (Gain-Loss)
+                out[i,k] = max(min(Relative,1.0),0.0)
+    return out
 
 
+if __name__ == '__main__':
+    main()
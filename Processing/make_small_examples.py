@@ -25,6 +25,7 @@
 import h5py
 import numpy as np
 import aggregate as ag
+import feature_store as fs
 import sys
 import time
 from numba import jit
@@ -34,18 +35,14 @@ from multiprocessing import Pool
 NumSkips = 200
 
 def main():
-    AllDataFile = h5py.File("2min_aggregated_features.hdf5", "r")
+    AllDataFile = fs.OpenFeatureFile(fs.FeaturesName)
     if 'FeatureParams' not in AllDataFile:
         sys.exit(0)
     grp = AllDataFile['FeatureParams']
     if 'StridesLPR' not in grp:
         sys.exit(0)
 
-    FeatureParams = ag.FeatureParameters()
-    FeatureParams.StridesLPR = grp['StridesLPR'][:]
-    FeatureParams.StridesSMA = grp['StridesSMA'][:]
-    FeatureParams.VolumeIntervals = grp['VolumeIntervals'][:]
-    FeatureParams.IntervalsPerDay = AllDataFile['AAPL'].attrs['IntervalsPerDay']
+    FeatureParams = fs.LoadFeatureParams(AllDataFile)
 
     T0 = time.time()
 
@@ -102,6 +99,7 @@ def GenerateExamples(AllData,FeatureParams,Loss=0.99,Gain=1.02,Horizon=195):
     # go through tuples in sorted order, copying examples into HDF5
     # AllSymbols = AllSymbols[:5]
 
+    fs.ShareFeatureFile(AllData)
     if True:
         Features   = []
         Outcomes   = []
@@ -116,7 +114,7 @@ def GenerateExamples(AllData,FeatureParams,Loss=0.99,Gain=1.02,Horizon=195):
                 Timestamps.append(T)
             print('added',len(F),' for symbol',sym)
     else:
-        p = Pool(16)
+        p = Pool(16,initializer=fs.OpenFeatureFile,initargs=(fs.FeaturesName,))
         results = p.starmap(
             GenerateExamplesForSymbol,
             [(sym,FeatureParams,Loss,Gain,Horizon) for sym in AllSymbols]
@@ -143,7 +141,7 @@ def GenerateExamplesForSymbol(Data,FeatureParams,Loss=0.99,Gain=1.02,Horizon=195
     '''GenerateExamplesForSymbol(Data,FeatureParams,Loss,Gain,Horizon)
 
     Arguments:
-    - Data -- h5py dataset for a symbol
+    - Data -- name of the symbol's data set in the features file
     - FeatureParams -- ag.FeatureParameters(), initiated from the HDF5 file
     - Loss -- acceptable loss factor (stop loss level for sell)
     - Gain -- gain factor (limit order for sell)
@@ -156,8 +154,7 @@ def GenerateExamplesForSymbol(Data,FeatureParams,Loss=0.99,Gain=1.02,Horizon=195
     - Features[i,:],Outcomes[i],Timestamps[i] go together as one example
     - all examples are sorted according to Timestamps, increasing order
     '''
-    AllDataFile = h5py.File("2min_aggregated_features.hdf5", "r")
-    Data = AllDataFile[Data][:]
+    Data = fs.ReadSymbol(Data)
     # print(type(Data))
     IntervalsPerDay = FeatureParams.IntervalsPerDay
     MinTimeIdx = FeatureParams.StridesLPR[0]*NumSkips
@@ -26,6 +26,9 @@ import h5py
 import numpy as np
 import matplotlib.pyplot as plt
 from keras.models import load_model
+import example_stream as es
+import feature_stats as st
+import prediction_cache as pc
 
 def main():
     Gain = '0.5'
@@ -37,10 +40,14 @@ def main():
     NameRoot = 'my_model_'
 
     whichplot = 1
+    # same as when the model was trained, see feed_forward.py
+    # (adds '_Norm' to the model name)
+    Normalize = True
 
     extension = Gain+','+Loss +'_open'
-    ExamplesFile = h5py.File("2min_examples_"+extension+".hdf5", "r")
-    # ExamplesFile = h5py.File("2min_aggregated_examples_"+extension+".hdf5", "r")
+    ExamplesName = "2min_examples_"+extension+".hdf5"
+    # ExamplesName = "2min_aggregated_examples_"+extension+".hdf5"
+    ExamplesFile = h5py.File(ExamplesName, "r")
 
     SaveName = NameRoot+extension
     if MSE_Loss:
@@ -49,10 +56,11 @@ def main():
         SaveName = SaveName + '_Lin'
     if DropFrac!='0.7':
         SaveName = SaveName + '_' + DropFrac
+    if Normalize:
+        SaveName = SaveName + '_Norm'
     # SaveName = 'Trained/' + SaveName + "_"+NEpochs+"_"+val_loss+".h5"
     SaveName = 'Trained/' + SaveName + "_"+NEpochs+".h5"
     print(SaveName)
-    model = load_model(SaveName)
 
     print(extension)
     if MSE_Loss:
@@ -74,12 +82,28 @@ def main():
     # x_train = ExamplesFile['Features'][:StartTest]
     # y_train = ExamplesFile['Outcomes'][:StartTest]
 
-    x_test = ExamplesFile['Features'][StartTest:EndTest]
+    Normalization = st.LoadNormalization(ExamplesFile) if Normalize else None
+    if Normalize and Normalization is None:
+        print('no normalization parameters in examples file, run feed_forward.py first')
+        return
+
+    def Compute(PredictionsName):
+        # only load the model when the predictions are not cached
+        model = load_model(SaveName)
+        PredictionsFile = h5py.File(PredictionsName, "w")
+        PredictToFile(model,ExamplesFile,PredictionsFile,StartTest,EndTest,
+            Normalization=Normalization)
+        PredictionsFile.close()
+    # predictions are kept in pc.CacheDir, keyed by the model file
+    # contents and the examples file and range
+    PredictionsName = pc.CachedPredictions(SaveName,ExamplesName,StartTest,EndTest,Compute,
+        Tag='normalized' if Normalize else '')
+    PredictionsFile = h5py.File(PredictionsName, "r")
+    y_predict = PredictionsFile['Predictions'][:]
+    t_test = PredictionsFile['Timestamps'][:]
+    PredictionsFile.close()
     y_test = ExamplesFile['Outcomes'][StartTest:EndTest]
-    t_test = ExamplesFile['Timestamps'][StartTest:EndTest]
 
-    y_predict = model.predict_on_batch(x_test)
-    y_predict = np.array([y_predict[i][0] for i in range(len(y_predict))])
     Rearrange = y_predict.argsort()
     # flip so losses are at right of plot
     # don't flip to keep losses at the left
@@ -107,6 +131,44 @@ def main():
 
 
 
+def PredictToFile(model,ExamplesFile,PredictionsFile,Start,Stop,BatchSize=10000,Normalization=None):
+    '''PredictToFile(model,ExamplesFile,PredictionsFile,Start,Stop,BatchSize,Normalization)
+    model predictions for a range of examples, in fixed size batches
+
+    Arguments:
+    - model -- trained keras model
+    - ExamplesFile -- h5py.File() with 'Features' and 'Timestamps'
+    - PredictionsFile -- h5py.File(), open for writing
+    - Start, Stop -- range of examples to predict
+    - BatchSize -- examples per batch; memory use does not depend on Stop-Start
+    - Normalization -- optional (FeatureMean,FeatureStd), as used for training
+
+    Result:
+    - PredictionsFile['Predictions'][i] is the prediction for example Start+i
+    - PredictionsFile['Timestamps'] are the timestamps of those examples
+    - attrs 'Start', 'Stop' and 'ExamplesFile' record where they came from
+    '''
+    Predictions = PredictionsFile.create_dataset('Predictions', (Stop-Start,), dtype=np.float32)
+    Timestamps = PredictionsFile.create_dataset('Timestamps', (Stop-Start,),
+        dtype=ExamplesFile['Timestamps'].dtype)
+    PredictionsFile.attrs['Start'] = Start
+    PredictionsFile.attrs['Stop'] = Stop
+    PredictionsFile.attrs['ExamplesFile'] = ExamplesFile.filename
+
+    # read batches ahead while the model predicts
+    Loader = es.BatchLoader([ExamplesFile['Features'],ExamplesFile['Timestamps']],BatchSize)
+    Ranges = [(b,min(b+BatchSize,Stop)) for b in range(Start,Stop,BatchSize)]
+    for (b0,b1),(x,t) in zip(Ranges,Loader.Load(Ranges)):
+        if Normalization is not None:
+            # x is the loader's buffer, scale it in place
+            x -= Normalization[0]
+            x /= Normalization[1]
+        Predictions[b0-Start:b1-Start] = np.ravel(model.predict_on_batch(x))
+        Timestamps[b0-Start:b1-Start] = t
+    print(Loader.Report())
+    Loader.close()
+
+
 if __name__ == '__main__':
     main()
 
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+# MIT License
+
+# Copyright (c) 2018 Andrew J. Bean
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import json
+import os
+import time
+import file_hash as fh
+
+# where cached predictions live, and how much disk they may use
+CacheDir = 'PredictionCache'
+MaxCacheBytes = 10*2**30
+
+
+def CacheKey(ModelName,ExamplesName,Start,Stop,Tag=''):
+    '''CacheKey(ModelName,ExamplesName,Start,Stop,Tag)
+    key of the predictions of a model for a range of examples
+
+    - the model is identified by the hash of its file, so a retrained
+      model saved under the same name gets new predictions
+    - the examples file by its path, size and modification time
+      (hashing it would take as long as predicting)
+    - Tag -- anything else that changes the predictions (e.g. normalization)
+    '''
+    Stat = os.stat(ExamplesName)
+    Description = json.dumps({
+        'model':fh.FileHash(ModelName),
+        'examples':[os.path.abspath(ExamplesName),Stat.st_size,Stat.st_mtime],
+        'range':[int(Start),int(Stop)],
+        'tag':Tag,
+        },sort_keys=True)
+    return hashlib.sha1(Description.encode('utf-8')).hexdigest()
+
+
+def LoadIndex(Dir=CacheDir):
+    """{key: {'file', 'size', 'used', 'model', 'examples', 'range'}}"""
+    IndexName = os.path.join(Dir,'index.json')
+    if not os.path.exists(IndexName):
+        return {}
+    with open(IndexName) as f:
+        return json.load(f)
+
+
+def SaveIndex(Index,Dir=CacheDir):
+    IndexName = os.path.join(Dir,'index.json')
+    with open(IndexName+'.tmp','w') as f:
+        json.dump(Index,f,indent=1,sort_keys=True)
+    os.replace(IndexName+'.tmp',IndexName)
+
+
+def Evict(Index,MaxBytes,Keep=None,Dir=CacheDir):
+    '''remove least recently used entries (other than Keep) until
+    the cache uses at most MaxBytes of disk'''
+    Total = sum(e['size'] for e in Index.values())
+    for Key in sorted(Index,key=lambda k: Index[k]['used']):
+        if Total <= MaxBytes:
+            break
+        if Key == Keep:
+            continue
+        Entry = Index.pop(Key)
+        Total -= Entry['size']
+        FName = os.path.join(Dir,Entry['file'])
+        if os.path.exists(FName):
+            os.remove(FName)
+        print('evicted cached predictions',Entry['file'])
+
+
+def CachedPredictions(ModelName,ExamplesName,Start,Stop,Compute,Tag='',
+        Dir=CacheDir,MaxBytes=MaxCacheBytes):
+    '''CachedPredictions(ModelName,ExamplesName,Start,Stop,Compute,Tag,Dir,MaxBytes)
+    file with the predictions of a model for examples Start to Stop,
+    made by Compute only if they are not already in the cache
+
+    Arguments:
+    - ModelName -- trained model file
+    - ExamplesName -- examples HDF5 file
+    - Start, Stop -- range of examples
+    - Compute -- function, Compute(FName) writes the predictions to FName
+      (e.g. loads the model and calls play_model.PredictToFile)
+    - Tag -- as for CacheKey
+    - Dir -- cache directory, with an index.json of its entries
+    - MaxBytes -- least recently used entries are removed beyond this size
+
+    Return Value:
+    - name of the predictions file, valid until a later call evicts it
+    '''
+    if not os.path.isdir(Dir):
+        os.makedirs(Dir)
+    Key = CacheKey(ModelName,ExamplesName,Start,Stop,Tag)
+    Index = LoadIndex(Dir)
+    Entry = Index.get(Key)
+    if Entry is not None and os.path.exists(os.path.join(Dir,Entry['file'])):
+        print('using cached predictions',Entry['file'])
+    else:
+        Entry = {
+            'file':Key+'.hdf5',
+            'model':ModelName,
+            'examples':ExamplesName,
+            'range':[int(Start),int(Stop)],
+            }
+        FName = os.path.join(Dir,Entry['file'])
+        # not in the index until it is complete
+        Compute(FName+'.tmp')
+        os.replace(FName+'.tmp',FName)
+        Entry['size'] = os.path.getsize(FName)
+        Index[Key] = Entry
+    Entry['used'] = time.time()
+    Evict(Index,MaxBytes,Keep=Key,Dir=Dir)
+    SaveIndex(Index,Dir)
+    return os.path.join(Dir,Entry['file'])